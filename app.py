@@ -1,125 +1,426 @@
 import os
 import json
-import pandas as pd
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from importlib import import_module
 from lib.data_preparation import process_data
 from lib.discrepancy_detection import detect_all_discrepancies
-from lib.break_classification_agent import classify_breaks 
-from lib.shares_break_resolver_agent import resolve_shares_break
-from lib.tax_break_resolver_agent import resolve_tax_break
-from lib.prioritization_agent import add_priorities_to_results
+from lib.partitioned_join import combine_partitions, iter_detected_partitions
+from lib.break_aggregation import break_pattern, mark_explained_breaks
+from lib.break_history import BreakHistory
+from lib.records import ClassifiedBreak, EventResult, Resolution, candidate_of, iter_break_candidates, results_to_frame
+from lib.model_routing import print_routing_summary, reset_routing_metrics
+from lib.stage_graph import StageGraph
+from lib.work_queue import WorkQueue
 
-def _process_break(break_type: str, explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str) -> dict:
+# Resolver agent per break type as "module:function". Each entry becomes its own
+# "resolve:<break type>" stage, so DPS, FX and Other agents plug in by registering them here.
+# Agent modules (and the Anthropic SDK) are only imported on their first LLM call.
+BREAK_RESOLVERS = {
+    "Shares Break": "lib.shares_break_resolver_agent:resolve_shares_break",
+    "Tax Break": "lib.tax_break_resolver_agent:resolve_tax_break",
+}
+
+# Concurrency and queue size per stage. Resolver stages use the "resolve" settings.
+STAGE_WORKERS = {"prepare": 1, "detect": 1, "classify": 4, "resolve": 2, "collect": 1, "prioritize": 1, "write": 1}
+STAGE_QUEUE_SIZE = 16
+
+# History of resolved breaks, used to reuse the conclusions of identical breaks and to weight
+# recurring breaks in prioritization. Set to None to resolve every break without history.
+BREAK_HISTORY_PATH = "data/break_history.db"
+
+class ReconciliationError(RuntimeError):
+    """
+    Raised when items of a reconciliation failed, e.g. rows whose classification failed and are
+    missing from the output, or a prioritization or write that failed. errors holds the
+    (stage, item, exception) tuples of the stage graph.
+    """
+
+    def __init__(self, errors: list, message: str = "Reconciliation failed"):
+        self.errors = errors
+        failed_stages = ", ".join(f"{stage}: {count}" for stage, count in Counter(stage for stage, _, _ in errors).items())
+        super().__init__(f"{message}: {len(errors)} item(s) failed ({failed_stages}). First error: {errors[0][2]}")
+
+@lru_cache(maxsize=None)
+def _load_agent(agent_path: str):
+    """Import an agent function given as "module:function"."""
+    module_name, function_name = agent_path.split(":")
+    return getattr(import_module(module_name), function_name)
+
+@lru_cache(maxsize=None)
+def _open_break_history(path: str) -> BreakHistory:
+    return BreakHistory(path)
+
+def _break_history() -> BreakHistory | None:
+    return _open_break_history(BREAK_HISTORY_PATH) if BREAK_HISTORY_PATH else None
+
+def classify_breaks(candidate) -> str:
+    return _load_agent("lib.break_classification_agent:classify_breaks")(candidate)
+
+def add_priorities_to_results(results: list) -> list:
+    return _load_agent("lib.prioritization_agent:add_priorities_to_results")(results)
+
+def _process_break(classified_break: ClassifiedBreak) -> Resolution:
     """Process a specific break type using the appropriate agent."""
+    # Another break of the event explains the whole deviation, so no agent call is needed
+    if classified_break.explained_by:
+        return Resolution.skipped(classified_break)
+
+    break_type = classified_break.break_type
+    candidate = classified_break.candidate
+    history = _break_history()
+    reused = history.reuse(classified_break) if history is not None else None
+    if reused is not None:
+        print(f"\nReusing the {reused.conclusion} conclusion of an identical {break_type.lower()} from the history")
+        return reused
+
     print(f"\nRunning {break_type.lower()} agent...")
-    
-    if break_type == "Shares Break":
-        result = resolve_shares_break(explanation, organisation_name, ticker, ex_date_cstd)
-    elif break_type == "Tax Break":
-        result = resolve_tax_break(explanation, organisation_name, ticker, ex_date_cstd)
-    else:
-        return {'conclusion': 'NEED_INFO', 'explanation': f'Agent not yet implemented for: {break_type}'}
-    
+
+    if break_type not in BREAK_RESOLVERS:
+        return Resolution(classified_break, 'NEED_INFO', f'Agent not yet implemented for: {break_type}')
+
+    result = _load_agent(BREAK_RESOLVERS[break_type])(
+        classified_break.explanation, candidate.organisation_name, candidate.ticker, candidate.ex_date_cstd
+    )
+
     print(f"{break_type} agent result:")
     print(result)
-    
+
     try:
-        return json.loads(result)
+        return Resolution.from_agent_result(classified_break, json.loads(result))
     except json.JSONDecodeError:
-        return {
-            'conclusion': 'NEED_INFO', 
-            'explanation': f'Could not parse {break_type.lower()} agent result'
-        }
+        return Resolution(classified_break, 'NEED_INFO', f'Could not parse {break_type.lower()} agent result')
 
-def _save_results(results: dict, data_folder: str = "data") -> None:
+def _save_results(results: list, data_folder: str = "data", file_name: str = "output.csv") -> None:
     """Save results to CSV file."""
     if not results:
         print("\nNo results to write to CSV")
         return
-    
-    csv_data = []
-    for (coac_id, bank_account), data in results.items():
-        csv_data.append({
-            'coac_id': coac_id,
-            'bank_account': bank_account,
-            'conclusion': data['conclusion'],
-            'explanation': data['explanation'],
-            'deviation': data['deviation'],
-            'settlement_currency': data['settlement_currency'],
-            'execution_date': data['execution_date'],
-            'priority': data.get('priority', 'N/A')
-        })
-    
-    results_df = pd.DataFrame(csv_data)
-    output_path = os.path.join(data_folder, 'output.csv')
+
+    results_df = results_to_frame(results)
+    output_path = os.path.join(data_folder, file_name)
     results_df.to_csv(output_path, index=False)
     print(f"\nResults written to {output_path} with {len(results)} entries")
 
-def process_dividend_reconciliation(nbim_file=None, custody_file=None):
+def _record_resolution(events: dict, resolution: Resolution) -> None:
+    """Add a resolution to the EventResult of its event in events, keyed by (coac_id, bank_account)."""
+    candidate = resolution.classified_break.candidate
+    key = (candidate.coac_id, candidate.bank_account)
+    events.setdefault(key, EventResult(candidate)).add(resolution)
+
+def _prioritized_rows(events: dict) -> list:
     """
-    Main function to process dividend reconciliation with break detection and resolution.
-    First, it processes the data and detects all discrepancies using simple rules.
-    Then, it classifies the discrepancies into different types of breaks using an LLM.
-    Finally, it resolves the breaks using specialized agents for each type of break.
+    One result row per event with its combined conclusion and how often its breaks recurred,
+    prioritized. The resolutions of every break are then added to the break history.
     """
-    print(f"Processing files: {nbim_file} and {custody_file}")
-    
-    merged_df = process_data(nbim_file, custody_file)
-    merged_df = detect_all_discrepancies(merged_df)
-    
-    results = {}
-    
-    for index, row in merged_df.iterrows():
-        deviation = abs(row['NET_AMOUNT_SETTLEMENT_CSTD'] - row['NET_AMOUNT_SETTLEMENT_NBIM'])
-        if deviation / row['NET_AMOUNT_SETTLEMENT_NBIM'] <= 0.01:
-            continue
-            
-        breaks_raw = classify_breaks(row)
+    history = _break_history()
+    rows = []
+    for event in events.values():
+        row = event.to_result_row()
+        if history is not None:
+            row.recurrences = history.recurrences(
+                event.candidate, [resolution.classified_break.break_type for resolution in event.resolutions]
+            )
+        rows.append(row)
+
+    rows = add_priorities_to_results(rows)
+    if history is not None:
+        history.record(resolution for event in events.values() for resolution in event.resolutions)
+    return rows
+
+def _item_pair(item):
+    """The file pair a stage graph item belongs to."""
+    if isinstance(item, dict):
+        return item.get('pair')
+    candidate = candidate_of(item)
+    return candidate.pair if candidate is not None else None
+
+def _resolver_stage_name(break_type: str) -> str:
+    return f"resolve:{break_type}"
+
+def _file_label(file) -> str:
+    """Name of a file path or of an in-memory buffer such as an uploaded file."""
+    return getattr(file, 'name', None) or str(file)
+
+def _run_cpu_bound(executor, func, *args):
+    """Run func in the executor (e.g. a process pool) when one is given, otherwise inline."""
+    if executor is None:
+        return func(*args)
+    return executor.submit(func, *args).result()
+
+def _spill_frame(merged_df, frames_dir: str) -> str:
+    """Write a detected frame to a new file in frames_dir and return its path."""
+    file_descriptor, frame_path = tempfile.mkstemp(dir=frames_dir, prefix="frame_", suffix=".pkl")
+    os.close(file_descriptor)
+    merged_df.to_pickle(frame_path)
+    return frame_path
+
+def _merged_frame(state: dict, pair):
+    """The detected frame of a pair, read back from frames_dir and combined in merge order, or None."""
+    frame_paths = state.get("frames", {}).get(pair)
+    return combine_partitions(frame_paths) if frame_paths else None
+
+def build_reconciliation_graph(state: dict, on_event=None, executor=None, save_results=None, cpu_workers: int = 1,
+                               break_sink=None, cancel_event=None, partitions: int | None = None,
+                               frames_dir: str | None = None) -> StageGraph:
+    """
+    Build the reconciliation pipeline as a stage graph:
+    prepare -> detect -> classify -> resolve:<break type> -> collect -> prioritize -> write.
+
+    Entry items are {"pair", "nbim_file", "custody_file"} dicts, and every item passed
+    between stages carries its "pair", so one graph (and one set of LLM stages) can serve
+    several file pairs. Rows flow through as soon as their upstream work is done.
+    The row count of every detected frame is stored in state["row_counts"][pair], the resolutions
+    of every break per event in state["events"][pair] (see EventResult) and the prioritized
+    result rows in state["results"][pair] once they are written. Detected frames are only kept
+    when frames_dir is given, as files listed in state["frames"][pair] (see _merged_frame).
+    Prepare and detect run in the executor when one is given.
+    With partitions, each pair is joined and flagged as that many hash partitions in a
+    process pool (lib/partitioned_join.py) and rows flow on as each partition finishes.
+    Only the row count and the flagged rows of a partition are sent back from the pool, which
+    is the executor when given and otherwise a new pool with one process per CPU.
+    Resolutions are collected per event until all are in, then every pair is prioritized and
+    written as its own item, so a failure for one pair does not stop the others.
+    save_results(pair, results) replaces the default write to data/output.csv.
+    When break_sink(break_item) is given, every classified break is handed to it
+    (e.g. a work queue) and the graph ends after classification.
+    """
+    graph = StageGraph(on_event=on_event, cancel_event=cancel_event)
+    state.setdefault("row_counts", {})
+    state.setdefault("frames", {})
+    state.setdefault("events", {})
+    state.setdefault("results", {})
+    save_results = save_results or (lambda pair, results: _save_results(results))
+    resolver_stages = [_resolver_stage_name(break_type) for break_type in BREAK_RESOLVERS]
+
+    def prepare(item, emit):
+        print(f"Processing files: {_file_label(item['nbim_file'])} and {_file_label(item['custody_file'])}")
+        if partitions:
+            # Without an executor the partitions get their own pool with a worker per CPU
+            for row_count, flagged_df, frame_path in iter_detected_partitions(
+                item['nbim_file'], item['custody_file'], partitions, cpu_workers if executor else None,
+                executor=executor, frames_dir=frames_dir,
+            ):
+                emit("detect", {
+                    'pair': item['pair'], 'merged_df': flagged_df, 'detected': True,
+                    'row_count': row_count, 'frame_path': frame_path,
+                })
+            return
+        merged_df = _run_cpu_bound(executor, process_data, item['nbim_file'], item['custody_file'])
+        emit("detect", {'pair': item['pair'], 'merged_df': merged_df})
+
+    def detect(item, emit):
+        merged_df = item['merged_df']
+        frame_path = item.get('frame_path')
+        if not item.get('detected'):
+            merged_df = _run_cpu_bound(executor, detect_all_discrepancies, merged_df)
+            if frames_dir is not None:
+                frame_path = _spill_frame(merged_df, frames_dir)
+        state["row_counts"].setdefault(item['pair'], []).append(item.get('row_count', len(merged_df)))
+        if frame_path is not None:
+            state["frames"].setdefault(item['pair'], []).append(frame_path)
+        state["events"].setdefault(item['pair'], {})
+        for candidate in iter_break_candidates(merged_df, item['pair']):
+            emit("classify", candidate)
+
+    def classify(candidate, emit):
+        breaks_raw = classify_breaks(candidate)
         print("Breaks detected:")
         print(breaks_raw)
-        
-        row_data = {
-            'organisation_name': row['ORGANISATION_NAME'],
-            'ticker': row['TICKER'],
-            'ex_date_cstd': row['EX_DATE_CSTD'],
-            'coac_id': row['COAC_EVENT_KEY'],
-            'bank_account': row['CUSTODY'],
-            'settlement_currency': row['SETTLEMENT_CURRENCY_CSTD'],
-            'deviation': deviation,
-            'currency': row['SETTLEMENT_CURRENCY_CSTD'],
-            'execution_date': row['EX_DATE_CSTD'].strftime('%Y-%m-%d') if pd.notna(row['EX_DATE_CSTD']) else "2024-01-01"
-        }
-        
+
         try:
-            breaks = json.loads(breaks_raw)
-            breaks = breaks.get("problems", [])
-            
-            # Process each identified break
-            for pot_break in breaks:
-                break_type = pot_break.get("name")
-                explanation = pot_break.get("explanation", f"{break_type} detected")
-                
-                agent_result = _process_break(
-                    break_type, explanation, 
-                    row_data['organisation_name'], 
-                    row_data['ticker'], 
-                    row_data['ex_date_cstd']
-                )
-                
-                results[(row_data['coac_id'], row_data['bank_account'])] = {
-                    'conclusion': agent_result.get('conclusion', 'NEED_INFO'),
-                    'explanation': agent_result.get('explanation', 'No explanation provided'),
-                    'deviation': row_data['deviation'],
-                    'settlement_currency': row_data['settlement_currency'],
-                    'execution_date': row_data['execution_date']
-                }
-                
+            breaks = json.loads(breaks_raw).get("problems", [])
         except json.JSONDecodeError:
             print("Could not parse classification output as JSON")
             print("Raw output:", breaks_raw)
-    
-    results = add_priorities_to_results(results)
-    
-    _save_results(results)
-    
-    return merged_df
+            return
+
+        classified_breaks = [
+            ClassifiedBreak(
+                candidate, break_index, pot_break.get("name"),
+                pot_break.get("explanation", f"{pot_break.get('name')} detected"),
+                pattern=break_pattern(candidate, pot_break.get("name")),
+            )
+            for break_index, pot_break in enumerate(breaks)
+        ]
+        mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+        # The event row is only needed for classification, the candidate lives on in the event's results
+        candidate.values = {}
+
+        # The breaks of an event go to their resolver stages independently, so they are resolved concurrently
+        for classified_break in classified_breaks:
+            if break_sink is not None:
+                break_sink(classified_break)
+            elif classified_break.break_type in BREAK_RESOLVERS and not classified_break.explained_by:
+                emit(_resolver_stage_name(classified_break.break_type), classified_break)
+            else:
+                resolve(classified_break, emit)
+
+    def resolve(classified_break, emit):
+        emit("collect", _process_break(classified_break))
+
+    def collect(resolution, emit):
+        pair = resolution.classified_break.candidate.pair
+        _record_resolution(state["events"][pair], resolution)
+
+    def close_collect(emit):
+        for pair in state["events"]:
+            emit("prioritize", {'pair': pair})
+
+    def prioritize(item, emit):
+        results = _prioritized_rows(state["events"][item['pair']])
+        emit("write", {'pair': item['pair'], 'results': results})
+
+    def write(item, emit):
+        save_results(item['pair'], item['results'])
+        state["results"][item['pair']] = item['results']
+
+    graph.add_stage("prepare", prepare, max(cpu_workers, STAGE_WORKERS["prepare"]), STAGE_QUEUE_SIZE, downstream=["detect"])
+    graph.add_stage("detect", detect, max(cpu_workers, STAGE_WORKERS["detect"]), STAGE_QUEUE_SIZE, downstream=["classify"])
+    if break_sink is not None:
+        graph.add_stage("classify", classify, STAGE_WORKERS["classify"], STAGE_QUEUE_SIZE)
+        return graph
+
+    graph.add_stage("classify", classify, STAGE_WORKERS["classify"], STAGE_QUEUE_SIZE,
+                    downstream=resolver_stages + ["collect"])
+    for stage_name in resolver_stages:
+        graph.add_stage(stage_name, resolve, STAGE_WORKERS["resolve"], STAGE_QUEUE_SIZE, downstream=["collect"])
+    graph.add_stage("collect", collect, STAGE_WORKERS["collect"], STAGE_QUEUE_SIZE,
+                    downstream=["prioritize"], on_close=close_collect)
+    graph.add_stage("prioritize", prioritize, STAGE_WORKERS["prioritize"], STAGE_QUEUE_SIZE, downstream=["write"])
+    graph.add_stage("write", write, STAGE_WORKERS["write"], STAGE_QUEUE_SIZE)
+    return graph
+
+def process_dividend_reconciliation(nbim_file=None, custody_file=None, on_event=None, cancel_event=None,
+                                    partitions: int | None = None, return_frame: bool | None = None):
+    """
+    Main function to process dividend reconciliation with break detection and resolution.
+    First, it processes the data and detects all discrepancies using simple rules.
+    Then, it classifies the discrepancies into different types of breaks using an LLM.
+    Finally, it resolves the breaks using specialized agents for each type of break.
+    The steps run as a stage graph, so rows are resolved while others are still being classified.
+    The files can be paths or in-memory buffers. on_event receives the stage graph events
+    and setting cancel_event stops the run without writing results. For large files,
+    partitions joins and flags the data as that many hash partitions in a process pool.
+    Raises ReconciliationError when any row, the prioritization or the write failed,
+    after the results of the other rows have been written.
+    With return_frame, the detected frame is kept on disk during the run and combined at the
+    end to be returned, which takes as much memory as the whole file. It defaults to True
+    without partitions and to False with partitions, so a partitioned run returns None and
+    its memory stays bounded by the partition size.
+    """
+    if return_frame is None:
+        return_frame = not partitions
+    # The routing summary covers this run only, also in a long-lived dashboard server
+    reset_routing_metrics()
+    state = {}
+    with tempfile.TemporaryDirectory(prefix="frames_") if return_frame else nullcontext() as frames_dir:
+        graph = build_reconciliation_graph(
+            state, on_event=on_event, cancel_event=cancel_event, partitions=partitions, frames_dir=frames_dir
+        )
+        errors = graph.run("prepare", [{'pair': None, 'nbim_file': nbim_file, 'custody_file': custody_file}])
+        if None not in state["row_counts"] and errors:
+            raise errors[0][2]
+        print_routing_summary()
+        if errors:
+            raise ReconciliationError(errors)
+
+        return _merged_frame(state, None)
+
+def enqueue_dividend_reconciliation(nbim_file, custody_file, queue: WorkQueue, run_id: str | None = None) -> str:
+    """
+    Prepare, detect and classify the files, and enqueue every break as a resolution task
+    so that worker processes (see run_resolution_worker) can resolve them. Returns the run id.
+    The run is only sealed when every row was classified and enqueued; otherwise a
+    ReconciliationError is raised and collecting the run would wait for the missing rows.
+    """
+    run_id = queue.create_run(run_id)
+    state = {}
+    graph = build_reconciliation_graph(
+        state, break_sink=lambda classified_break: queue.enqueue(run_id, classified_break.to_payload())
+    )
+    errors = graph.run("prepare", [{'pair': run_id, 'nbim_file': nbim_file, 'custody_file': custody_file}])
+    if run_id not in state["row_counts"] and errors:
+        raise errors[0][2]
+    if errors:
+        raise ReconciliationError(errors, f"Run {run_id} was not sealed")
+    queue.seal_run(run_id)
+    print(f"Enqueued run {run_id}: {queue.run_status(run_id)['counts']}")
+    return run_id
+
+@contextmanager
+def _lease_heartbeat(queue: WorkQueue, task_id: int, worker_id: str):
+    """Extend the lease of a task every third of the visibility timeout until the block is done."""
+    done = threading.Event()
+
+    def extend():
+        while not done.wait(queue.visibility_timeout_s / 3):
+            if not queue.extend_lease(task_id, worker_id):
+                print(f"Lease on task {task_id} was lost, another worker may resolve it too")
+                return
+
+    heartbeat = threading.Thread(target=extend, name=f"lease-{task_id}", daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        done.set()
+        heartbeat.join()
+
+def run_resolution_worker(queue: WorkQueue, worker_id: str | None = None, poll_interval_s: float = 5.0,
+                          exit_when_idle: bool = False) -> int:
+    """Lease and resolve break tasks until stopped (or until idle). Returns the number of tasks handled."""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    handled = 0
+    while True:
+        task = queue.lease(worker_id)
+        if task is None:
+            if exit_when_idle:
+                return handled
+            time.sleep(poll_interval_s)
+            continue
+
+        try:
+            # Resolutions with web search and an escalated call can outlast the visibility timeout
+            with _lease_heartbeat(queue, task['task_id'], worker_id):
+                resolution = _process_break(ClassifiedBreak.from_payload(task['payload']))
+        except Exception as e:
+            print(f"Task {task['task_id']} failed on attempt {task['attempt']}: {e}")
+            queue.fail(task['task_id'], worker_id, str(e))
+        else:
+            agent_result = {'conclusion': resolution.conclusion, 'explanation': resolution.explanation}
+            if not queue.complete(task['task_id'], worker_id, agent_result):
+                print(f"Lease on task {task['task_id']} expired before its result was posted")
+        handled += 1
+
+def collect_queued_results(queue: WorkQueue, run_id: str, poll_interval_s: float = 10.0,
+                           timeout_s: float | None = None, data_folder: str = "data") -> list:
+    """
+    Wait until every task of the run is done or dead, then assemble, prioritize and save the results.
+    Dead tasks are reported as NEED_INFO with the last error.
+    """
+    reset_routing_metrics()
+    started = time.time()
+    while not queue.run_status(run_id)['finished']:
+        if timeout_s is not None and time.time() - started > timeout_s:
+            raise TimeoutError(f"Run {run_id} did not finish within {timeout_s}s")
+        time.sleep(poll_interval_s)
+
+    events = {}
+    for task in queue.run_tasks(run_id):
+        agent_result = task['result'] or {
+            'conclusion': 'NEED_INFO',
+            'explanation': f"Resolution failed after retries: {task['error']}"
+        }
+        classified_break = ClassifiedBreak.from_payload(task['payload'])
+        _record_resolution(events, Resolution.from_agent_result(classified_break, agent_result))
 
+    results = _prioritized_rows(events)
+    _save_results(results, data_folder=data_folder)
+    print_routing_summary()
+    return results
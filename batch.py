@@ -0,0 +1,191 @@
+"""
+Headless batch runner for reconciling many NBIM/Custody file pairs, e.g. from a nightly scheduler.
+
+Usage:
+    python batch.py --input-dir incoming/ --output-dir results/
+    python batch.py --manifest pairs.csv --output-dir results/ --workers 4 --requests-per-minute 40
+
+Exit codes: 0 = all pairs reconciled, 1 = at least one pair or row failed, 2 = invalid input.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from app import build_reconciliation_graph, _item_pair, _save_results
+from lib.llm_client import set_rate_limit
+from lib.model_routing import print_routing_summary, reset_routing_metrics
+from lib.records import results_to_frame
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_INVALID_INPUT = 2
+
+def discover_pairs(input_dir: str) -> list:
+    """
+    Pair every CSV file with NBIM in its name with the file that has CUSTODY in its place,
+    e.g. NBIM_Dividend_Bookings_2025Q1.csv and CUSTODY_Dividend_Bookings_2025Q1.csv.
+    """
+    pairs = []
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.lower().endswith(".csv") or "NBIM" not in file_name:
+            continue
+        custody_name = file_name.replace("NBIM", "CUSTODY", 1)
+        custody_path = os.path.join(input_dir, custody_name)
+        if not os.path.exists(custody_path):
+            print(f"No custody file found for {file_name}, expected {custody_name}")
+            continue
+        pair_name = os.path.splitext(file_name.replace("NBIM", "", 1))[0].strip("_- ") or "pair"
+        pairs.append({
+            'pair': pair_name,
+            'nbim_file': os.path.join(input_dir, file_name),
+            'custody_file': custody_path,
+        })
+    return pairs
+
+def read_manifest(manifest_path: str) -> list:
+    """
+    Read pairs from a CSV manifest with the columns nbim_file, custody_file and optionally name.
+    Relative paths are resolved against the folder of the manifest.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pairs = []
+    with open(manifest_path, newline="") as manifest:
+        for line_number, entry in enumerate(csv.DictReader(manifest), start=2):
+            if not entry.get('nbim_file') or not entry.get('custody_file'):
+                raise ValueError(f"Manifest line {line_number} needs both nbim_file and custody_file")
+            nbim_file = os.path.join(base_dir, entry['nbim_file'])
+            pairs.append({
+                'pair': entry.get('name') or os.path.splitext(os.path.basename(nbim_file))[0],
+                'nbim_file': nbim_file,
+                'custody_file': os.path.join(base_dir, entry['custody_file']),
+            })
+    return pairs
+
+def _validate_pairs(pairs: list) -> None:
+    seen = set()
+    for pair in pairs:
+        if pair['pair'] in seen:
+            raise ValueError(f"Duplicate pair name: {pair['pair']}")
+        seen.add(pair['pair'])
+        for key in ('nbim_file', 'custody_file'):
+            if not os.path.exists(pair[key]):
+                raise ValueError(f"File not found for pair {pair['pair']}: {pair[key]}")
+
+def run_batch(pairs: list, output_dir: str, workers: int = 4, requests_per_minute: float | None = None,
+              partitions: int | None = None) -> dict:
+    """
+    Prepare and detect all pairs in a process pool and run classification, resolution and
+    prioritization for every pair through one shared, rate-limited set of LLM stages.
+    Writes <pair>_output.csv per pair and consolidated_output.csv, and returns a summary.
+    With partitions, large pairs are joined and flagged as hash partitions instead.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    set_rate_limit(requests_per_minute)
+    reset_routing_metrics()
+    started = time.time()
+
+    summary = {
+        pair['pair']: {'status': 'ok', 'rows': 0, 'classified': 0, 'results': 0, 'failures': 0, 'output_file': None}
+        for pair in pairs
+    }
+
+    def on_event(event):
+        pair = _item_pair(event['item'])
+        if pair not in summary:
+            return
+        if event['status'] == 'failed':
+            summary[pair]['failures'] += 1
+        elif event['stage'] == 'classify' and event['status'] == 'completed':
+            summary[pair]['classified'] += 1
+
+    def save_results(pair, results):
+        file_name = f"{pair}_output.csv"
+        if results:
+            _save_results(results, data_folder=output_dir, file_name=file_name)
+        else:
+            # Every pair gets an output file, with only the header when it has no breaks
+            results_to_frame([]).to_csv(os.path.join(output_dir, file_name), index=False)
+        summary[pair]['output_file'] = os.path.join(output_dir, file_name)
+
+    state = {}
+    # The pool is first used from stage worker threads, and forking a process with running threads can deadlock
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver")) as executor:
+        graph = build_reconciliation_graph(
+            state, on_event=on_event, executor=executor, save_results=save_results, cpu_workers=workers,
+            partitions=partitions
+        )
+        graph.run("prepare", pairs)
+
+    consolidated = []
+    for pair in pairs:
+        pair_summary = summary[pair['pair']]
+        row_counts = state["row_counts"].get(pair['pair'])
+        results = state["results"].get(pair['pair'], [])
+        pair_summary['rows'] = sum(row_counts or [])
+        pair_summary['results'] = len(results)
+        if row_counts is None or (state["events"].get(pair['pair']) and pair_summary['output_file'] is None):
+            pair_summary['status'] = 'failed'
+        elif pair_summary['failures']:
+            pair_summary['status'] = 'partial'
+        if results:
+            consolidated.append(results_to_frame(results).assign(pair=pair['pair']))
+
+    if consolidated:
+        pd.concat(consolidated, ignore_index=True).to_csv(
+            os.path.join(output_dir, 'consolidated_output.csv'), index=False
+        )
+
+    return {
+        'pairs': summary,
+        'failed_pairs': sum(1 for pair in summary.values() if pair['status'] != 'ok'),
+        'duration_s': round(time.time() - started, 1),
+    }
+
+def _print_summary(summary: dict) -> None:
+    print("\nBatch summary:")
+    for pair, pair_summary in summary['pairs'].items():
+        print(
+            f"  {pair:<30} {pair_summary['status']:<8} rows={pair_summary['rows']:<6} "
+            f"classified={pair_summary['classified']:<6} results={pair_summary['results']:<6} "
+            f"failures={pair_summary['failures']}"
+        )
+    print(f"  {len(summary['pairs'])} pair(s), {summary['failed_pairs']} with failures, {summary['duration_s']}s")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile many NBIM/Custody dividend file pairs.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir", help="Folder with NBIM*.csv files and their CUSTODY*.csv counterparts")
+    source.add_argument("--manifest", help="CSV with the columns nbim_file, custody_file and optionally name")
+    parser.add_argument("--output-dir", default="data/batch", help="Folder for per-pair and consolidated outputs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes used to prepare and detect")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="Shared limit on LLM calls per minute")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="Join and flag each pair as this many hash partitions to bound memory on large files")
+    args = parser.parse_args(argv)
+
+    try:
+        pairs = discover_pairs(args.input_dir) if args.input_dir else read_manifest(args.manifest)
+        _validate_pairs(pairs)
+    except (OSError, ValueError) as e:
+        print(f"Invalid input: {e}")
+        return EXIT_INVALID_INPUT
+    if not pairs:
+        print("No NBIM/Custody file pairs found")
+        return EXIT_INVALID_INPUT
+
+    summary = run_batch(pairs, args.output_dir, max(args.workers, 1), args.requests_per_minute, args.partitions)
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    _print_summary(summary)
+    print_routing_summary()
+
+    return EXIT_FAILURES if summary['failed_pairs'] else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
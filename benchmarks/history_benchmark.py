@@ -0,0 +1,99 @@
+"""
+Query benchmark for the break history (lib/break_history.py).
+
+Fills a temporary history with synthetic breaks (by default 1,000,000, i.e. years of
+quarterly runs) and measures the lookups used during a run:
+- find_reusable, once per tax break before its resolver is called
+- recurrences, once per event before prioritization
+- find by issuer country and break type
+
+    python benchmarks/history_benchmark.py
+    python benchmarks/history_benchmark.py --breaks 5000000 --queries 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.break_history import REUSABLE_BREAK_TYPES, BreakHistory
+from lib.records import BreakCandidate, ClassifiedBreak, Resolution
+
+COUNTRIES = ["US", "KR", "CH", "JP", "GB", "DE", "FR", "NO", "SE", "CN"]
+CUSTODIANS = ["JPMORGAN_CHASE", "HSBC_KOREA", "UBS_SWITZERLAND", "CITI", "BNY_MELLON"]
+BREAK_TYPES = ["Tax Break", "Shares Break", "DPS Break", "FX Break"]
+CONCLUSIONS = ["NBIM_WRONG", "CUSTODY_WRONG", "NEED_INFO"]
+
+def _synthetic_break(rng: random.Random, event: int, tickers: int) -> ClassifiedBreak:
+    ticker = rng.randrange(tickers)
+    candidate = BreakCandidate(
+        pair=None, coac_id=event, bank_account=rng.randrange(100), organisation_name=None,
+        ticker=f"T{ticker}", ex_date_cstd=None, settlement_currency="USD",
+        deviation=rng.uniform(1, 10_000), execution_date="2025-01-01",
+        issuer_country=COUNTRIES[ticker % len(COUNTRIES)], custodian=CUSTODIANS[ticker % len(CUSTODIANS)],
+    )
+    break_type = rng.choice(BREAK_TYPES)
+    return ClassifiedBreak(candidate, 0, break_type, "", pattern=f"pattern {rng.randrange(5)}")
+
+def fill_history(history: BreakHistory, breaks: int, tickers: int, seed: int = 0, batch_size: int = 50_000) -> None:
+    rng = random.Random(seed)
+    for start in range(0, breaks, batch_size):
+        history.record([
+            Resolution(_synthetic_break(rng, event, tickers), rng.choice(CONCLUSIONS), "synthetic")
+            for event in range(start, min(start + batch_size, breaks))
+        ])
+
+def _median_ms(func, items) -> float:
+    timings = []
+    for item in items:
+        started = time.perf_counter()
+        func(item)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def run_benchmark(breaks: int, tickers: int, queries: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        history = BreakHistory(os.path.join(workdir, "break_history.db"))
+        started = time.perf_counter()
+        fill_history(history, breaks, tickers)
+        fill_s = time.perf_counter() - started
+
+        rng = random.Random(1)
+        probes = [_synthetic_break(rng, breaks + i, tickers) for i in range(queries)]
+        return {
+            "fill_s": fill_s,
+            "find_reusable_ms": _median_ms(
+                history.find_reusable, [probe for probe in probes if probe.break_type in REUSABLE_BREAK_TYPES]
+            ),
+            "recurrences_ms": _median_ms(
+                lambda probe: history.recurrences(probe.candidate, [probe.break_type]), probes
+            ),
+            "find_ms": _median_ms(
+                lambda probe: history.find(issuer_country=probe.candidate.issuer_country,
+                                           break_type=probe.break_type, limit=20),
+                probes,
+            ),
+        }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure break history lookups on a large synthetic history.")
+    parser.add_argument("--breaks", type=int, default=1_000_000)
+    parser.add_argument("--tickers", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.breaks, args.tickers, args.queries)
+    print(f"Break history benchmark with {args.breaks} breaks over {args.tickers} tickers "
+          f"(median of {args.queries} queries):")
+    print(f"  fill:          {result['fill_s']:.1f}s")
+    print(f"  find_reusable: {result['find_reusable_ms']:.3f}ms")
+    print(f"  recurrences:   {result['recurrences_ms']:.3f}ms")
+    print(f"  find:          {result['find_ms']:.3f}ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Startup benchmark for the dashboard.
+
+Measures, each in a fresh Python process:
+- import time of the app module
+- time to first render of dashboard.py (with Streamlit's AppTest, without a browser)
+
+Run it on the current tree, and on another revision to compare before and after:
+    python benchmarks/startup_benchmark.py
+    git worktree add /tmp/before <revision>
+    python benchmarks/startup_benchmark.py --repo /tmp/before
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_APP = """
+import sys, time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+print(int("anthropic" in sys.modules))
+"""
+
+FIRST_RENDER = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app_test = AppTest.from_file("dashboard.py", default_timeout=120).run()
+print(time.perf_counter() - start)
+print(int(not app_test.exception))
+"""
+
+def _measure(repo: str, code: str) -> tuple:
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=repo, capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONPATH=repo),
+    )
+    elapsed, flag = completed.stdout.strip().splitlines()[-2:]
+    return float(elapsed), bool(int(flag))
+
+def run_benchmark(repo: str, repeats: int) -> dict:
+    imports = [_measure(repo, IMPORT_APP) for _ in range(repeats)]
+    renders = [_measure(repo, FIRST_RENDER) for _ in range(repeats)]
+    return {
+        "import_app_s": statistics.median(elapsed for elapsed, _ in imports),
+        "anthropic_imported_with_app": imports[0][1],
+        "first_render_s": statistics.median(elapsed for elapsed, _ in renders),
+        "render_succeeded": all(ok for _, ok in renders),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure app import time and dashboard time to first render.")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="Checkout to benchmark (defaults to this one)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(os.path.abspath(args.repo), args.repeats)
+    print(f"Startup benchmark for {args.repo} (median of {args.repeats}):")
+    print(f"  import app:             {result['import_app_s']:.3f}s "
+          f"(anthropic imported: {result['anthropic_imported_with_app']})")
+    print(f"  first dashboard render: {result['first_render_s']:.3f}s "
+          f"(succeeded: {result['render_succeeded']})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,29 @@
 import streamlit as st
 import pandas as pd
-import os
-import tempfile
-from app import process_dividend_reconciliation
+import io
+import time
+from lib.run_manager import RunManager
+from lib.results_view import count_pages, file_signature, filter_options, filter_results, load_results, paginate
 
 st.set_page_config(page_title="Dividend Reconciliation Dashboard", layout="wide")
 
+@st.cache_resource
+def get_run_manager() -> RunManager:
+    """One run manager per server process, shared by all sessions and reruns."""
+    return RunManager()
+
+def _uploaded_buffer(uploaded_file) -> io.BytesIO:
+    buffer = io.BytesIO(uploaded_file.getvalue())
+    buffer.name = uploaded_file.name
+    return buffer
+
+run_manager = get_run_manager()
+
+# Reattach to the run in the URL after a browser refresh, or to any run still in progress
+current_run = run_manager.get(st.query_params.get("run_id")) or run_manager.active_run()
+if current_run is not None:
+    st.query_params["run_id"] = current_run.run_id
+
 st.title("🏦 Dividend Reconciliation Dashboard")
 
 st.header("📁 Upload CSV Files")
@@ -18,67 +36,103 @@ with col1:
 with col2:
     custody_file = st.file_uploader("Upload Custody Dividend Bookings CSV", type="csv", key="custody")
 
-if st.button("Process Files", type="primary"):
+run_in_progress = current_run is not None and current_run.is_running
+if st.button("Process Files", type="primary", disabled=run_in_progress):
     if nbim_file is not None and custody_file is not None:
-        with st.spinner("Processing files..."):
-            # Save uploaded files temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_nbim:
-                tmp_nbim.write(nbim_file.getvalue())
-                nbim_path = tmp_nbim.name
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_custody:
-                tmp_custody.write(custody_file.getvalue())
-                custody_path = tmp_custody.name
-            
-            try:
-                st.info("🔄 Processing files... This may take several minutes due to API calls.")
-                
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                status_text.text("Starting processing...")
-                progress_bar.progress(10)
-                
-                result = process_dividend_reconciliation(nbim_file=nbim_path, custody_file=custody_path)
-                
-                progress_bar.progress(100)
-                status_text.text("Processing completed!")
-                st.success("✅ Processing completed!")
-                
-                os.unlink(nbim_path)
-                os.unlink(custody_path)
-                
-            except Exception as e:
-                st.error(f"❌ Error processing files: {str(e)}")
-                st.info("💡 This might be due to API rate limits or connection timeouts. Try again in a few minutes.")
-                try:
-                    os.unlink(nbim_path)
-                    os.unlink(custody_path)
-                except:
-                    pass
+        # Imported on first use so browsing results does not load the pipeline
+        from app import process_dividend_reconciliation
+
+        current_run = run_manager.start(
+            process_dividend_reconciliation,
+            nbim_file=_uploaded_buffer(nbim_file),
+            custody_file=_uploaded_buffer(custody_file),
+        )
+        st.query_params["run_id"] = current_run.run_id
     else:
         st.warning("⚠️ Please upload both CSV files")
 
+@st.fragment(run_every="2s")
+def show_run_progress(run_id: str) -> None:
+    """Poll the background run; rerun the whole page once it finishes to refresh the results."""
+    run = run_manager.get(run_id)
+    if run is None:
+        return
+
+    if run.is_running:
+        st.info(f"🔄 Run {run.run_id} in progress. You can refresh or close the page and come back.")
+        st.progress(run.progress, text=f"{run.done + run.failed} of {run.queued} steps done")
+        if st.button("Cancel run", key=f"cancel_{run.run_id}"):
+            run_manager.cancel(run.run_id)
+            st.warning("Cancelling... steps already started will finish first.")
+    elif run.status == "completed":
+        st.success(f"✅ Run {run.run_id} completed!")
+    elif run.status == "cancelled":
+        st.warning(f"⏹️ Run {run.run_id} was cancelled. No results were written.")
+    else:
+        st.error(f"❌ Error processing files: {run.error}")
+        st.info("💡 This might be due to API rate limits or connection timeouts. Try again in a few minutes.")
+
+    events = run.recent_events()
+    if events:
+        with st.expander("Progress events", expanded=run.is_running):
+            for timestamp, status, message in events:
+                icon = "⚠️" if status == "failed" else "✔️"
+                st.text(f"{time.strftime('%H:%M:%S', time.localtime(timestamp))} {icon} {message}")
+
+    if not run.is_running and st.session_state.get("refreshed_run") != run.run_id:
+        st.session_state["refreshed_run"] = run.run_id
+        st.rerun()
+
+if current_run is not None:
+    show_run_progress(current_run.run_id)
+
 st.header("📊 Results")
 
 output_file = "data/output.csv"
-if os.path.exists(output_file):
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_output(path: str, signature: tuple):
+    """Parse and sort the output once per file version (signature = mtime and size)."""
+    output_df, digest = load_results(path)
+    return output_df, digest, filter_options(output_df)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def filtered_output(digest: str, filters_key: tuple, _output_df: pd.DataFrame) -> pd.DataFrame:
+    return filter_results(_output_df, dict(filters_key))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def output_csv(digest: str, filters_key: tuple, _output_df: pd.DataFrame) -> bytes:
+    return _output_df.to_csv(index=False).encode("utf-8")
+
+signature = file_signature(output_file)
+if signature is not None:
     try:
-        output_df = pd.read_csv(output_file)
-        
-        if 'priority' in output_df.columns:
-            output_df['priority_numeric'] = pd.to_numeric(output_df['priority'], errors='coerce')
-            output_df = output_df.sort_values('priority_numeric', ascending=True)  # 1 = highest priority
-            output_df = output_df.drop('priority_numeric', axis=1)  # Remove helper column
-        
-        st.dataframe(output_df, use_container_width=True)
-        
-        csv = output_df.to_csv(index=False)
+        output_df, digest, options = load_output(output_file, signature)
+
+        filter_cols = st.columns(3)
+        filters = {
+            'conclusion': filter_cols[0].multiselect("Conclusion", options.get('conclusion', [])),
+            'currency': filter_cols[1].multiselect("Currency", options.get('currency', [])),
+            'custody_account': filter_cols[2].multiselect("Custody account", options.get('custody_account', [])),
+        }
+        filters_key = tuple((name, tuple(values)) for name, values in filters.items())
+        view_df = filtered_output(digest, filters_key, output_df)
+
+        page_cols = st.columns([1, 1, 4])
+        page_size = page_cols[0].selectbox("Rows per page", [25, 50, 100, 250], index=1)
+        page_count = count_pages(len(view_df), page_size)
+        page = page_cols[1].number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+        page_df, page_count = paginate(view_df, int(page), page_size)
+        page_cols[2].caption(f"{len(view_df)} of {len(output_df)} breaks, page {int(page)} of {page_count}")
+
+        st.dataframe(page_df, use_container_width=True)
+
         st.download_button(
             label="📥 Download Results as CSV",
-            data=csv,
+            data=lambda: output_csv(digest, filters_key, view_df),
             file_name="dividend_reconciliation_results.csv",
-            mime="text/csv"
+            mime="text/csv",
+            on_click="ignore"
         )
     except Exception as e:
         st.error(f"Error reading output file: {str(e)}")
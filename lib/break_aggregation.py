@@ -0,0 +1,95 @@
+import math
+
+from lib.records import BreakCandidate
+
+# A break fully explains an event when its quantified impact is within this share of the net deviation
+EXPLAINED_TOLERANCE = 0.02
+
+def _quantified_impact(candidate: BreakCandidate, break_type: str) -> float | None:
+    """
+    Change in NBIM's net settlement amount when only the factor behind the break type
+    (tax rate, number of shares, dividend per share or FX rate) is taken from custody.
+    """
+    net_settlement = candidate.get('NET_AMOUNT_SETTLEMENT_NBIM')
+    net_quotation = candidate.get('NET_AMOUNT_QUOTATION_NBIM')
+    gross_nbim = candidate.get('GROSS_AMOUNT_QUOTATION_NBIM')
+    gross_cstd = candidate.get('GROSS_AMOUNT_QUOTATION_CSTD')
+    dps_nbim = candidate.get('DIV_RATE_NBIM')
+    dps_cstd = candidate.get('DIV_RATE_CSTD')
+
+    if break_type == "Tax Break":
+        tax_rate_cstd = candidate.get('TOTAL_TAX_QUOTATION_CSTD') / gross_cstd
+        tax_difference = candidate.get('TOTAL_TAX_QUOTATION_NBIM') - gross_nbim * tax_rate_cstd
+        return tax_difference * net_settlement / net_quotation
+    if break_type == "Shares Break":
+        return net_settlement * ((gross_cstd / dps_cstd) / (gross_nbim / dps_nbim) - 1)
+    if break_type == "DPS Break":
+        return net_settlement * (dps_cstd / dps_nbim - 1)
+    if break_type == "FX Break":
+        return net_quotation / candidate.get('FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD') - net_settlement
+    return None
+
+def explained_deviation(candidate: BreakCandidate, break_type: str) -> float | None:
+    """Quantified impact of a break type on the net settlement amount, or None if it cannot be computed."""
+    try:
+        impact = _quantified_impact(candidate, break_type)
+    except (TypeError, ZeroDivisionError):
+        return None
+    return float(impact) if impact is not None and math.isfinite(impact) else None
+
+def mark_explained_breaks(candidate: BreakCandidate, classified_breaks: list, resolvable_types) -> None:
+    """
+    When one break alone accounts for the event's net deviation (custody minus NBIM net settlement
+    amount), mark the other breaks of the event as explained by it, so their resolvers are not called.
+    Only breaks of the resolvable_types (those with a resolver agent) can explain the others, so the
+    event's conclusion always comes from an agent.
+    """
+    if len(classified_breaks) < 2:
+        return
+    try:
+        net_deviation = float(candidate.get('NET_AMOUNT_SETTLEMENT_CSTD') - candidate.get('NET_AMOUNT_SETTLEMENT_NBIM'))
+    except TypeError:
+        return
+    if not math.isfinite(net_deviation):
+        return
+
+    for classified_break in classified_breaks:
+        if classified_break.break_type not in resolvable_types:
+            continue
+        impact = explained_deviation(candidate, classified_break.break_type)
+        if impact is not None and abs(impact - net_deviation) <= EXPLAINED_TOLERANCE * abs(net_deviation):
+            for other_break in classified_breaks:
+                if other_break is not classified_break:
+                    other_break.explained_by = classified_break.break_type
+            print(f"{classified_break.break_type} explains the net deviation of {net_deviation:.2f}, "
+                  f"skipping {len(classified_breaks) - 1} other break(s)")
+            return
+
+def break_pattern(candidate: BreakCandidate, break_type: str) -> str | None:
+    """
+    Signature of the mismatch behind a break, used to find identical breaks in the break history,
+    e.g. "tax_rate 0.2499 vs 0.2000" for a withholding tax rate that custody applies differently
+    every quarter. None for break types whose mismatch is specific to the event (FX and others).
+    """
+    try:
+        if break_type == "Tax Break":
+            values = (
+                candidate.get('TOTAL_TAX_QUOTATION_NBIM') / candidate.get('GROSS_AMOUNT_QUOTATION_NBIM'),
+                candidate.get('TOTAL_TAX_QUOTATION_CSTD') / candidate.get('GROSS_AMOUNT_QUOTATION_CSTD'),
+            )
+            label = "tax_rate {:.4f} vs {:.4f}"
+        elif break_type == "Shares Break":
+            shares_nbim = candidate.get('GROSS_AMOUNT_QUOTATION_NBIM') / candidate.get('DIV_RATE_NBIM')
+            shares_cstd = candidate.get('GROSS_AMOUNT_QUOTATION_CSTD') / candidate.get('DIV_RATE_CSTD')
+            values = (shares_cstd / shares_nbim,)
+            label = "shares_ratio {:.4f}"
+        elif break_type == "DPS Break":
+            values = (candidate.get('DIV_RATE_CSTD') / candidate.get('DIV_RATE_NBIM'),)
+            label = "dps_ratio {:.4f}"
+        else:
+            return None
+    except (TypeError, ZeroDivisionError):
+        return None
+    if not all(math.isfinite(value) for value in values):
+        return None
+    return label.format(*values)
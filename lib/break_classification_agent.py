@@ -1,84 +1,83 @@
-from anthropic import Anthropic
-import os
+from lib.llm_client import create_message
 import pandas as pd
 import json
+from lib.model_routing import route_call, validate_json_classification
+from lib.records import BreakCandidate
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
-
-def structure_break_candidates(row: pd.Series) -> dict:
+def structure_break_candidates(candidate: BreakCandidate) -> dict:
 
     problems = []
 
-    if row.get("BREAK_TAX", 0) == 1:
+    if candidate.get("BREAK_TAX", 0) == 1:
         problems.append({
             "name": "Tax Break",
-            "relevant parameters": _format_tax_parameters(row)
+            "relevant parameters": _format_tax_parameters(candidate)
         })
 
-    if row.get("BREAK_SHARES", 0) == 1:
+    if candidate.get("BREAK_SHARES", 0) == 1:
         problems.append({
             "name": "Shares Break",
-            "relevant parameters": _format_shares_parameters(row)
+            "relevant parameters": _format_shares_parameters(candidate)
         })
 
-    if row.get("BREAK_DPS", 0) == 1:
+    if candidate.get("BREAK_DPS", 0) == 1:
         problems.append({
             "name": "DPS Break",
-            "relevant parameters": _format_dps_parameters(row)
+            "relevant parameters": _format_dps_parameters(candidate)
         })
 
-    if row.get("BREAK_FX", 0) == 1:
+    if candidate.get("BREAK_FX", 0) == 1:
         problems.append({
             "name": "FX Break",
-            "relevant parameters": _format_fx_parameters(row)
+            "relevant parameters": _format_fx_parameters(candidate)
         })
 
     return {"problems": problems}
 
-def _format_tax_parameters(row: pd.Series) -> str:
+def _format_tax_parameters(candidate: BreakCandidate) -> str:
     return (
-        f"TOTAL_TAX_QUOTATION_NBIM={row.get('TOTAL_TAX_QUOTATION_NBIM')} vs "
-        f"TOTAL_TAX_QUOTATION_CSTD={row.get('TOTAL_TAX_QUOTATION_CSTD')}, "
-        f"GROSS_AMOUNT_QUOTATION_NBIM={row.get('GROSS_AMOUNT_QUOTATION_NBIM')}, "
-        f"GROSS_AMOUNT_QUOTATION_CSTD={row.get('GROSS_AMOUNT_QUOTATION_CSTD')}, "
-        f"NET_AMOUNT_QUOTATION_CSTD={row.get('NET_AMOUNT_QUOTATION_CSTD')}, "
-        f"NET_AMOUNT_QUOTATION_NBIM={row.get('NET_AMOUNT_QUOTATION_NBIM')}, "
-        f"LOCALTAX_COST_QUOTATION_NBIM_ONLY={row.get('LOCALTAX_COST_QUOTATION_NBIM_ONLY')}, "
-        f"WTHTAX_COST_QUOTATION_NBIM_ONLY={row.get('WTHTAX_COST_QUOTATION_NBIM_ONLY')}, "
-        f"TOTAL_TAX_RATE_CSTD={row.get('TOTAL_TAX_RATE_CSTD')}, "
-        f"TOTAL_TAX_RATE_NBIM={row.get('TOTAL_TAX_RATE_NBIM')}, "
-        f"POSSIBLE_RESTITUTION_PAYMENT_CSTD_ONLY={row.get('POSSIBLE_RESTITUTION_PAYMENT_CSTD_ONLY')}, "
-        f"POSSIBLE_RESTITUTION_AMOUNT_CSTD_ONLY={row.get('POSSIBLE_RESTITUTION_AMOUNT_CSTD_ONLY')}, "
-        f"EXRESPRDIV_COST_QUOTATION_NBIM_ONLY={row.get('EXRESPRDIV_COST_QUOTATION_NBIM_ONLY')}"
+        f"TOTAL_TAX_QUOTATION_NBIM={candidate.get('TOTAL_TAX_QUOTATION_NBIM')} vs "
+        f"TOTAL_TAX_QUOTATION_CSTD={candidate.get('TOTAL_TAX_QUOTATION_CSTD')}, "
+        f"GROSS_AMOUNT_QUOTATION_NBIM={candidate.get('GROSS_AMOUNT_QUOTATION_NBIM')}, "
+        f"GROSS_AMOUNT_QUOTATION_CSTD={candidate.get('GROSS_AMOUNT_QUOTATION_CSTD')}, "
+        f"NET_AMOUNT_QUOTATION_CSTD={candidate.get('NET_AMOUNT_QUOTATION_CSTD')}, "
+        f"NET_AMOUNT_QUOTATION_NBIM={candidate.get('NET_AMOUNT_QUOTATION_NBIM')}, "
+        f"LOCALTAX_COST_QUOTATION_NBIM_ONLY={candidate.get('LOCALTAX_COST_QUOTATION_NBIM_ONLY')}, "
+        f"WTHTAX_COST_QUOTATION_NBIM_ONLY={candidate.get('WTHTAX_COST_QUOTATION_NBIM_ONLY')}, "
+        f"TOTAL_TAX_RATE_CSTD={candidate.get('TOTAL_TAX_RATE_CSTD')}, "
+        f"TOTAL_TAX_RATE_NBIM={candidate.get('TOTAL_TAX_RATE_NBIM')}, "
+        f"POSSIBLE_RESTITUTION_PAYMENT_CSTD_ONLY={candidate.get('POSSIBLE_RESTITUTION_PAYMENT_CSTD_ONLY')}, "
+        f"POSSIBLE_RESTITUTION_AMOUNT_CSTD_ONLY={candidate.get('POSSIBLE_RESTITUTION_AMOUNT_CSTD_ONLY')}, "
+        f"EXRESPRDIV_COST_QUOTATION_NBIM_ONLY={candidate.get('EXRESPRDIV_COST_QUOTATION_NBIM_ONLY')}"
     )
 
-def _format_shares_parameters(row: pd.Series) -> str:
+def _format_shares_parameters(candidate: BreakCandidate) -> str:
     return (
-        f"NOMINAL_BASIS_NBIM={row.get('NOMINAL_BASIS_NBIM')}, "
-        f"HOLDING_QUANTITY_CSTD_ONLY={row.get('HOLDING_QUANTITY_CSTD_ONLY')}, "
-        f"NOMINAL_BASIS_CSTD={row.get('NOMINAL_BASIS_CSTD')}, "
-        f"LOAN_QUANTITY_CSTD_ONLY={row.get('LOAN_QUANTITY_CSTD_ONLY')}, "
-        f"LENDING_PERCENTAGE_CSTD_ONLY={row.get('LENDING_PERCENTAGE_CSTD_ONLY')}"
+        f"NOMINAL_BASIS_NBIM={candidate.get('NOMINAL_BASIS_NBIM')}, "
+        f"HOLDING_QUANTITY_CSTD_ONLY={candidate.get('HOLDING_QUANTITY_CSTD_ONLY')}, "
+        f"NOMINAL_BASIS_CSTD={candidate.get('NOMINAL_BASIS_CSTD')}, "
+        f"LOAN_QUANTITY_CSTD_ONLY={candidate.get('LOAN_QUANTITY_CSTD_ONLY')}, "
+        f"LENDING_PERCENTAGE_CSTD_ONLY={candidate.get('LENDING_PERCENTAGE_CSTD_ONLY')}"
     )
 
-def _format_dps_parameters(row: pd.Series) -> str:
+def _format_dps_parameters(candidate: BreakCandidate) -> str:
     return (
-        f"DIV_RATE_NBIM={row.get('DIV_RATE_NBIM')}, "
-        f"DIV_RATE_CSTD={row.get('DIV_RATE_CSTD')}"
+        f"DIV_RATE_NBIM={candidate.get('DIV_RATE_NBIM')}, "
+        f"DIV_RATE_CSTD={candidate.get('DIV_RATE_CSTD')}"
     )
 
-def _format_fx_parameters(row: pd.Series) -> str:
+def _format_fx_parameters(candidate: BreakCandidate) -> str:
     return (
-        f"FX_RATE_QUOTATION_TO_SETTLEMENT_NBIM={row.get('FX_RATE_QUOTATION_TO_SETTLEMENT_NBIM')}, "
-        f"FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD={row.get('FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD')}, "
-        f"EX_DATE_CSTD={row.get('EX_DATE_CSTD')}, "
-        f"EX_DATE_NBIM={row.get('EX_DATE_NBIM')}, "
-        f"PAYMENT_DATE_CSTD={row.get('PAYMENT_DATE_CSTD')}, "
-        f"PAYMENT_DATE_NBIM={row.get('PAYMENT_DATE_NBIM')}"
+        f"FX_RATE_QUOTATION_TO_SETTLEMENT_NBIM={candidate.get('FX_RATE_QUOTATION_TO_SETTLEMENT_NBIM')}, "
+        f"FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD={candidate.get('FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD')}, "
+        f"EX_DATE_CSTD={candidate.get('EX_DATE_CSTD')}, "
+        f"EX_DATE_NBIM={candidate.get('EX_DATE_NBIM')}, "
+        f"PAYMENT_DATE_CSTD={candidate.get('PAYMENT_DATE_CSTD')}, "
+        f"PAYMENT_DATE_NBIM={candidate.get('PAYMENT_DATE_NBIM')}"
     )
 
-def build_classification_prompt(row: pd.Series) -> dict:
+def build_classification_prompt(candidate: BreakCandidate) -> dict:
     """
     Build a classification prompt for the LLM to analyze dividend breaks.
     
@@ -94,7 +93,7 @@ def build_classification_prompt(row: pd.Series) -> dict:
         else:
             return v
     
-    suggestions = structure_break_candidates(row)
+    suggestions = structure_break_candidates(candidate)
     
     prompt_text = f"""We are reviewing a single dividend event to detect and classify **breaks** 
     (discrepancies) between NBIM’s expected dividend data and the custodian’s actual dividend data. 
@@ -125,7 +124,7 @@ def build_classification_prompt(row: pd.Series) -> dict:
     {json.dumps(suggestions, indent=2)}
 
     FULL EVENT DATA:
-    {json.dumps({k: clean_value(v) for k, v in row.to_dict().items()}, indent=2)}
+    {json.dumps({k: clean_value(v) for k, v in candidate.values.items()}, indent=2)}
 
     Note: Fields ending with _NBIM_ONLY or _CSTD_ONLY exist only in one file; others are common to both.
     Be concise and factual. Use only given values. If no break of a suggested type exists, omit it."""
@@ -136,11 +135,24 @@ def build_classification_prompt(row: pd.Series) -> dict:
         ],
     }
 
-def classify_breaks(row: pd.Series, model="claude-sonnet-4-20250514", max_tokens=600) -> str:
+def classify_breaks(candidate: BreakCandidate, model=None, max_tokens=600) -> str:
+    """
+    Classify the breaks of a candidate event. Without an explicit model the call is routed
+    cheap-first through the classification routing policy.
+    """
+    if model is not None:
+        return _request_classification(candidate, model, max_tokens)
+    return route_call(
+        "classification",
+        lambda routed_model: _request_classification(candidate, routed_model, max_tokens),
+        validate_json_classification,
+    )
+
+def _request_classification(candidate: BreakCandidate, model: str, max_tokens: int) -> str:
 
-    message_config = build_classification_prompt(row)
+    message_config = build_classification_prompt(candidate)
     
-    response = client.messages.create(
+    response = create_message(
         model=model,
         max_tokens=max_tokens,
         system=message_config["system"],
@@ -151,4 +163,4 @@ def classify_breaks(row: pd.Series, model="claude-sonnet-4-20250514", max_tokens
         if block.type == "text":
             return block.text
 
-    return "" 
\ No newline at end of file
+    return ""
\ No newline at end of file
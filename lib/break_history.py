@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from lib.records import BreakCandidate, ClassifiedBreak, Resolution
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS breaks (
+    break_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT NOT NULL,
+    issuer_country TEXT NOT NULL,
+    custodian TEXT NOT NULL,
+    break_type TEXT NOT NULL,
+    break_index INTEGER NOT NULL,
+    pattern TEXT,
+    coac_id TEXT NOT NULL,
+    bank_account TEXT NOT NULL,
+    execution_date TEXT,
+    deviation REAL,
+    settlement_currency TEXT,
+    conclusion TEXT NOT NULL,
+    explanation TEXT,
+    reused INTEGER NOT NULL DEFAULT 0,
+    recorded_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_breaks_event ON breaks(coac_id, bank_account, break_index);
+CREATE INDEX IF NOT EXISTS idx_breaks_key ON breaks(ticker, issuer_country, custodian, break_type, pattern, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_breaks_custodian ON breaks(custodian, issuer_country, break_type, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_breaks_country ON breaks(issuer_country, break_type, recorded_at);
+"""
+
+_COLUMNS = (
+    "ticker", "issuer_country", "custodian", "break_type", "break_index", "pattern", "coac_id", "bank_account",
+    "execution_date", "deviation", "settlement_currency", "conclusion", "explanation", "reused", "recorded_at",
+)
+
+# Conclusions that may be reused for an identical break
+REUSABLE_CONCLUSIONS = ("NBIM_WRONG", "CUSTODY_WRONG")
+# Break types whose conclusion may be reused. A tax rate pattern (e.g. the withholding rate a
+# custodian applies to a country) recurs every quarter, while share and DPS ratios are event specific.
+REUSABLE_BREAK_TYPES = ("Tax Break",)
+
+
+def _key_text(value) -> str:
+    """Text form of a key value, so 960789012, 960789012.0 and "960789012" are the same key."""
+    if pd.isna(value):
+        return ""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _break_key(candidate: BreakCandidate, break_type: str) -> tuple:
+    return (
+        _key_text(candidate.ticker), _key_text(candidate.issuer_country), _key_text(candidate.custodian),
+        _key_text(break_type),
+    )
+
+
+class BreakHistory:
+    """
+    Local history of resolved breaks in a SQLite file, one row per break of an event, so two
+    breaks of the same type in one event (e.g. two "Other" breaks) are both kept.
+
+    Breaks are indexed by ticker, issuer country, custodian and break type, so looking up
+    earlier occurrences of a break stays in the milliseconds over years of history.
+    Recording the same event again (e.g. a rerun of a file) replaces all its earlier rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def record(self, resolutions, recorded_at: float | None = None) -> int:
+        """
+        Store the resolutions of a run in one transaction, replacing the earlier rows of their events.
+        The resolutions of an event must all be recorded in the same call. Returns the number of breaks stored.
+        """
+        recorded_at = recorded_at or time.time()
+        rows = []
+        for resolution in resolutions:
+            classified_break = resolution.classified_break
+            candidate = classified_break.candidate
+            rows.append((
+                *_break_key(candidate, classified_break.break_type),
+                classified_break.break_index,
+                classified_break.pattern,
+                _key_text(candidate.coac_id),
+                _key_text(candidate.bank_account),
+                candidate.execution_date,
+                None if pd.isna(candidate.deviation) else float(candidate.deviation),
+                _key_text(candidate.settlement_currency),
+                resolution.conclusion,
+                resolution.explanation,
+                int(resolution.reused),
+                recorded_at,
+            ))
+
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        event_position = (_COLUMNS.index("coac_id"), _COLUMNS.index("bank_account"))
+        events = {tuple(row[position] for position in event_position) for row in rows}
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # A rerun may classify an event into other breaks, so none of its earlier rows are kept
+                connection.executemany("DELETE FROM breaks WHERE coac_id = ? AND bank_account = ?", events)
+                connection.executemany(
+                    f"INSERT INTO breaks ({', '.join(_COLUMNS)}) VALUES ({placeholders})", rows
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def find(self, ticker=None, issuer_country=None, custodian=None, break_type=None, limit: int = 100) -> list:
+        """
+        Most recently recorded breaks matching every given key,
+        e.g. find(issuer_country="KR", break_type="Tax Break") for Korean withholding tax breaks.
+        """
+        filters = {
+            "ticker": ticker, "issuer_country": issuer_country, "custodian": custodian, "break_type": break_type,
+        }
+        conditions = [f"{column} = ?" for column, value in filters.items() if value is not None]
+        parameters = [_key_text(value) for value in filters.values() if value is not None]
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT * FROM breaks {where}ORDER BY recorded_at DESC, break_id DESC LIMIT ?",
+                (*parameters, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recurrences(self, candidate: BreakCandidate, break_types) -> int:
+        """
+        How often the event's breaks recurred: the highest number of other events in the history
+        with the same ticker, issuer country, custodian and break type, over the given break types.
+        """
+        counts = [0]
+        with self._connect() as connection:
+            for break_type in set(break_types):
+                key = _break_key(candidate, break_type)
+                if not all(key[:3]):
+                    continue
+                counts.append(connection.execute(
+                    "SELECT COUNT(DISTINCT coac_id || '/' || bank_account) FROM breaks "
+                    "WHERE ticker = ? AND issuer_country = ? AND custodian = ? AND break_type = ? "
+                    "AND NOT (coac_id = ? AND bank_account = ?)",
+                    (*key, _key_text(candidate.coac_id), _key_text(candidate.bank_account)),
+                ).fetchone()[0])
+        return max(counts)
+
+    def find_reusable(self, classified_break: ClassifiedBreak, min_matches: int = 2, lookback: int = 5) -> dict | None:
+        """
+        The latest conclusion of an identical tax break (same ticker, issuer country, custodian
+        and tax rate pattern) of another event, when there are at least min_matches agent
+        conclusions for that pattern and the last lookback of them agree on NBIM_WRONG or
+        CUSTODY_WRONG. Reused conclusions do not count, so every reuse goes back to agent conclusions.
+        """
+        candidate = classified_break.candidate
+        key = _break_key(candidate, classified_break.break_type)
+        if classified_break.break_type not in REUSABLE_BREAK_TYPES or not classified_break.pattern or not all(key):
+            return None
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM breaks "
+                "WHERE ticker = ? AND issuer_country = ? AND custodian = ? AND break_type = ? AND pattern = ? "
+                "AND NOT (coac_id = ? AND bank_account = ?) AND reused = 0 AND conclusion != 'SKIPPED' "
+                "ORDER BY recorded_at DESC, break_id DESC LIMIT ?",
+                (*key, classified_break.pattern, _key_text(candidate.coac_id), _key_text(candidate.bank_account),
+                 lookback),
+            ).fetchall()
+        conclusions = {row["conclusion"] for row in rows}
+        if len(rows) < min_matches or len(conclusions) != 1 or not conclusions <= set(REUSABLE_CONCLUSIONS):
+            return None
+        return dict(rows[0])
+
+    def reuse(self, classified_break: ClassifiedBreak) -> Resolution | None:
+        """A Resolution that reuses the conclusion of an identical earlier break, or None."""
+        prior = self.find_reusable(classified_break)
+        if prior is None:
+            return None
+        return Resolution(
+            classified_break,
+            prior["conclusion"],
+            f"{prior['explanation']} (Conclusion reused from the identical {prior['break_type'].lower()} "
+            f"of event {prior['coac_id']} / {prior['bank_account']}, ex-date {prior['execution_date']})",
+            reused=True,
+        )
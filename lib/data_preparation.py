@@ -31,6 +31,13 @@ def convert_dates(df):
             df[col] = pd.to_datetime(df[col], format='%d.%m.%Y', errors='coerce')
     return df
 
+def add_reference_fields(df):
+    """Add the ISIN and custodian of each event, taken from NBIM with the custody file as fallback."""
+    for field in ('ISIN', 'CUSTODIAN'):
+        if f'{field}_NBIM' in df.columns and f'{field}_CSTD' in df.columns:
+            df[field] = df[f'{field}_NBIM'].fillna(df[f'{field}_CSTD'])
+    return df
+
 def remove_columns(df):
     columns_to_remove = [
         'ISIN_NBIM', 'ISIN_CSTD', 'SEDOL_NBIM', 'SEDOL_CSTD',
@@ -63,6 +70,8 @@ def organize_columns(df):
         'TICKER': 'TICKER',
         'ORGANISATION_NAME': 'ORGANISATION_NAME',
         'CUSTODY': 'CUSTODY',
+        'ISIN': 'ISIN',
+        'CUSTODIAN': 'CUSTODIAN',
         
        # Matching columns
         'EVENT_EX_DATE': 'EX_DATE_CSTD',
@@ -124,9 +133,10 @@ def process_data(nbim_file, custody_file):
     1. Load CSV files
     2. Merge data on common keys
     3. Convert date columns
-    4. Clean unnecessary columns
-    5. Add calculated fields originally missing in the NBIM file
-    6. Standardize column names and order to make it easier for LLM to analyze
+    4. Keep the ISIN and custodian as reference fields
+    5. Clean unnecessary columns
+    6. Add calculated fields originally missing in the NBIM file
+    7. Standardize column names and order to make it easier for LLM to analyze
     
     Returns:
         pd.DataFrame: Processed and merged data
@@ -135,6 +145,7 @@ def process_data(nbim_file, custody_file):
     nbim_df, custody_df = load_csv_files(nbim_file, custody_file)
     merged_df = merge_dataframes(nbim_df, custody_df)
     merged_df = convert_dates(merged_df)
+    merged_df = add_reference_fields(merged_df)
     merged_df = remove_columns(merged_df)
     merged_df = add_calculated_fields(merged_df)
     merged_df = organize_columns(merged_df)
@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+from functools import lru_cache
+
+# Shared limit on API requests per minute, e.g. across all file pairs of a batch run
+_rate_limit = {"interval_s": 0.0, "next_slot": 0.0}
+_rate_limit_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_client():
+    """
+    Return the Anthropic client shared by all agents. The SDK is imported and the
+    client constructed on the first LLM call rather than when the agents are imported.
+    """
+    from anthropic import Anthropic
+
+    return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+def set_rate_limit(requests_per_minute: float | None) -> None:
+    """Limit the number of API requests per minute across all threads. None disables the limit."""
+    with _rate_limit_lock:
+        _rate_limit["interval_s"] = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        _rate_limit["next_slot"] = 0.0
+
+def _wait_for_rate_limit() -> None:
+    with _rate_limit_lock:
+        if not _rate_limit["interval_s"]:
+            return
+        now = time.monotonic()
+        slot = max(now, _rate_limit["next_slot"])
+        _rate_limit["next_slot"] = slot + _rate_limit["interval_s"]
+    time.sleep(slot - now)
+
+def create_message(**kwargs):
+    """
+    Send one messages.create request through the shared client once the rate limit allows it.
+    Every API request goes through here, including tool use follow-ups and calls with an explicit model.
+    """
+    _wait_for_rate_limit()
+    return get_client().messages.create(**kwargs)
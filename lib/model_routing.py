@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+SMALL_MODEL = "claude-3-5-haiku-20241022"
+LARGE_MODEL = "claude-sonnet-4-20250514"
+
+VALID_CONCLUSIONS = {"NEED_INFO", "CUSTODY_WRONG", "NBIM_WRONG"}
+
+# Routing policy per agent. Models are tried in order (cheapest first) and the call
+# escalates to the next tier when the response fails validation, is NEED_INFO or
+# reports LOW confidence (when enabled for the agent).
+ROUTING_POLICIES = {
+    "classification": {
+        "models": [SMALL_MODEL, LARGE_MODEL],
+        "escalate_on_need_info": False,
+        "escalate_on_low_confidence": False,
+    },
+    "shares": {
+        "models": [SMALL_MODEL, LARGE_MODEL],
+        "escalate_on_need_info": True,
+        "escalate_on_low_confidence": True,
+    },
+    "tax": {
+        "models": [SMALL_MODEL, LARGE_MODEL],
+        "escalate_on_need_info": True,
+        "escalate_on_low_confidence": True,
+    },
+    "prioritization": {
+        "models": [SMALL_MODEL, LARGE_MODEL],
+        "escalate_on_need_info": False,
+        "escalate_on_low_confidence": False,
+    },
+}
+
+DEFAULT_POLICY = {
+    "models": [LARGE_MODEL],
+    "escalate_on_need_info": False,
+    "escalate_on_low_confidence": False,
+}
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def configure_routing(agent_name: str, **overrides) -> dict:
+    """
+    Override the routing policy of an agent, e.g.
+    configure_routing("tax", models=[LARGE_MODEL]) to always use the large model.
+    """
+    policy = dict(ROUTING_POLICIES.get(agent_name, DEFAULT_POLICY))
+    policy.update(overrides)
+    ROUTING_POLICIES[agent_name] = policy
+    return policy
+
+
+def get_policy(agent_name: str) -> dict:
+    return ROUTING_POLICIES.get(agent_name, DEFAULT_POLICY)
+
+
+def validate_json_resolution(response_text: str, policy: dict) -> str | None:
+    """Return the reason to escalate a resolver response, or None if it can be accepted."""
+    try:
+        result = json.loads(response_text)
+    except (json.JSONDecodeError, TypeError):
+        return "response is not valid JSON"
+
+    if not isinstance(result, dict) or result.get("conclusion") not in VALID_CONCLUSIONS:
+        return "response has no valid conclusion"
+    if not result.get("explanation"):
+        return "response has no explanation"
+    if policy.get("escalate_on_need_info") and result["conclusion"] == "NEED_INFO":
+        return "conclusion is NEED_INFO"
+    if policy.get("escalate_on_low_confidence") and str(result.get("confidence", "")).upper() == "LOW":
+        return "confidence is LOW"
+    return None
+
+
+def validate_json_classification(response_text: str, policy: dict) -> str | None:
+    """Return the reason to escalate a classification response, or None if it can be accepted."""
+    try:
+        result = json.loads(response_text)
+    except (json.JSONDecodeError, TypeError):
+        return "response is not valid JSON"
+
+    problems = result.get("problems") if isinstance(result, dict) else None
+    if not isinstance(problems, list):
+        return "response has no problems list"
+    if any(not isinstance(problem, dict) or not problem.get("name") for problem in problems):
+        return "response has a problem without a name"
+    return None
+
+
+def route_call(agent_name: str, call, validate=None):
+    """
+    Run call(model) on the cheapest model in the agent's policy and escalate to the
+    next tier while validate(response, policy) returns a reason to escalate.
+    The response of the last tier is always returned.
+    """
+    policy = get_policy(agent_name)
+    models = policy["models"]
+
+    for tier, model in enumerate(models):
+        is_last_tier = tier == len(models) - 1
+        start = time.perf_counter()
+        try:
+            response = call(model)
+            reason = validate(response, policy) if validate else None
+        except Exception as e:
+            if is_last_tier:
+                _record(agent_name, model, time.perf_counter() - start, escalated=False)
+                raise
+            response = None
+            reason = f"call failed: {e}"
+
+        escalated = reason is not None and not is_last_tier
+        _record(agent_name, model, time.perf_counter() - start, escalated)
+        if not escalated:
+            return response
+        print(f"Escalating {agent_name} agent from {model}: {reason}")
+
+
+def _record(agent_name: str, model: str, latency: float, escalated: bool) -> None:
+    with _metrics_lock:
+        tier = _metrics.setdefault(agent_name, {}).setdefault(
+            model, {"calls": 0, "escalations": 0, "total_latency_s": 0.0}
+        )
+        tier["calls"] += 1
+        tier["escalations"] += int(escalated)
+        tier["total_latency_s"] += latency
+
+
+def get_routing_metrics() -> dict:
+    """Return calls, average latency and escalation rate per agent and model tier."""
+    with _metrics_lock:
+        summary = {}
+        for agent_name, tiers in _metrics.items():
+            summary[agent_name] = {}
+            for model, tier in tiers.items():
+                summary[agent_name][model] = {
+                    "calls": tier["calls"],
+                    "escalations": tier["escalations"],
+                    "escalation_rate": tier["escalations"] / tier["calls"],
+                    "avg_latency_s": tier["total_latency_s"] / tier["calls"],
+                }
+        return summary
+
+
+def reset_routing_metrics() -> None:
+    """Start counting from zero, e.g. at the start of each run in a long-lived process."""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def print_routing_summary() -> None:
+    summary = get_routing_metrics()
+    if not summary:
+        return
+    print("\nModel routing summary:")
+    for agent_name, tiers in summary.items():
+        for model, tier in tiers.items():
+            print(
+                f"  {agent_name:<15} {model:<30} calls={tier['calls']:<4} "
+                f"avg_latency={tier['avg_latency_s']:.2f}s escalation_rate={tier['escalation_rate']:.0%}"
+            )
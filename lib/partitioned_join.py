@@ -0,0 +1,129 @@
+import glob
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from lib.data_preparation import (
+    add_calculated_fields, add_reference_fields, convert_dates, merge_dataframes, organize_columns, remove_columns
+)
+from lib.discrepancy_detection import detect_all_discrepancies
+from lib.records import flag_break_rows
+
+PARTITION_KEY = 'COAC_EVENT_KEY'
+SORT_KEYS = ['COAC_EVENT_KEY', 'CUSTODY']
+
+def _partition_ids(keys: pd.Series, partitions: int) -> pd.Series:
+    """
+    Hash partition by COAC_EVENT_KEY. Numeric keys are hashed as float64 so that
+    the same key lands in the same partition whether a file reads it as int or float.
+    """
+    if pd.api.types.is_numeric_dtype(keys):
+        keys = keys.astype('float64')
+    else:
+        keys = keys.astype(str)
+    return pd.util.hash_pandas_object(keys, index=False) % partitions
+
+def partition_file(path, side: str, workdir: str, partitions: int, chunksize: int) -> None:
+    """
+    Stream a CSV file in chunks and append each chunk's rows to on-disk shards
+    <side>_<partition>_<chunk>.pkl, so the file is never fully loaded in memory.
+    An empty frame with the file's columns is kept as <side>_schema.pkl.
+    """
+    for chunk_number, chunk in enumerate(pd.read_csv(path, sep=';', chunksize=chunksize)):
+        if chunk_number == 0:
+            chunk.iloc[:0].to_pickle(os.path.join(workdir, f"{side}_schema.pkl"))
+        for partition, shard in chunk.groupby(_partition_ids(chunk[PARTITION_KEY], partitions), sort=False):
+            shard.to_pickle(os.path.join(workdir, f"{side}_{partition}_{chunk_number}.pkl"))
+
+def _read_shard(workdir: str, side: str, partition: int) -> pd.DataFrame:
+    pieces = sorted(
+        glob.glob(os.path.join(workdir, f"{side}_{partition}_*.pkl")),
+        key=lambda path: int(path.rsplit('_', 1)[1].split('.')[0])
+    )
+    if not pieces:
+        return pd.read_pickle(os.path.join(workdir, f"{side}_schema.pkl"))
+    return pd.concat([pd.read_pickle(piece) for piece in pieces])
+
+def process_partition(workdir: str, partition: int) -> pd.DataFrame:
+    """Join, prepare and flag one partition, the same way process_data and detect_all_discrepancies do."""
+    merged_df = merge_dataframes(_read_shard(workdir, 'nbim', partition), _read_shard(workdir, 'custody', partition))
+    merged_df = convert_dates(merged_df)
+    merged_df = add_reference_fields(merged_df)
+    merged_df = remove_columns(merged_df)
+    merged_df = add_calculated_fields(merged_df)
+    merged_df = organize_columns(merged_df)
+    return detect_all_discrepancies(merged_df)
+
+def flag_partition(workdir: str, partition: int, frames_dir: str | None = None) -> tuple:
+    """
+    Process one partition and return only (row count, flagged rows, frame path), so the full
+    frame is not sent back to the driver. With frames_dir, the full frame is written there
+    and its path returned, otherwise the frame path is None.
+    """
+    merged_df = process_partition(workdir, partition)
+    frame_path = None
+    if frames_dir is not None:
+        frame_path = os.path.join(frames_dir, f"partition_{partition}.pkl")
+        merged_df.to_pickle(frame_path)
+    return len(merged_df), flag_break_rows(merged_df), frame_path
+
+def iter_detected_partitions(nbim_file, custody_file, partitions: int = 8, workers: int | None = None,
+                             chunksize: int = 100_000, workdir: str | None = None, executor=None,
+                             frames_dir: str | None = None):
+    """
+    Hash-partition both files by COAC_EVENT_KEY into on-disk shards, then join, prepare and
+    flag every partition in a process pool. Yields (row count, flagged rows, frame path) per
+    partition as soon as it is done (see flag_partition), so memory is bounded by the partition
+    size in every process, including the driver. Partitions are yielded in completion order and
+    may be empty. With frames_dir, the full partition frames are kept there for combine_partitions.
+    An existing process pool can be passed as executor, otherwise one with the given workers is created.
+    """
+    with tempfile.TemporaryDirectory(dir=workdir, prefix="partitions_") as shard_dir:
+        partition_file(nbim_file, 'nbim', shard_dir, partitions, chunksize)
+        partition_file(custody_file, 'custody', shard_dir, partitions, chunksize)
+        if frames_dir is not None:
+            # One subdirectory per call, so several pairs can share a frames_dir
+            frames_dir = tempfile.mkdtemp(dir=frames_dir, prefix="frames_")
+
+        own_executor = executor is None
+        if own_executor:
+            # Not forked: the caller may have other threads running, e.g. the stage graph workers
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        try:
+            futures = [
+                executor.submit(flag_partition, shard_dir, partition, frames_dir) for partition in range(partitions)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+
+def combine_partitions(partition_dfs: list) -> pd.DataFrame:
+    """
+    Concatenate partition frames, or paths of frames written by flag_partition, in the order of
+    the single outer merge, which sorts by the join keys. The sort is stable, so rows with
+    equal keys keep their merge order.
+    """
+    partition_dfs = [
+        pd.read_pickle(partition_df) if isinstance(partition_df, str) else partition_df
+        for partition_df in partition_dfs
+    ]
+    non_empty = [partition_df for partition_df in partition_dfs if not partition_df.empty]
+    if len(non_empty) <= 1:
+        return non_empty[0] if non_empty else partition_dfs[0]
+    combined = pd.concat(non_empty, ignore_index=True)
+    return combined.sort_values(SORT_KEYS, kind='stable').reset_index(drop=True)
+
+def process_data_partitioned(nbim_file, custody_file, partitions: int = 8, workers: int | None = None,
+                             chunksize: int = 100_000) -> pd.DataFrame:
+    """Partitioned equivalent of detect_all_discrepancies(process_data(nbim_file, custody_file))."""
+    with tempfile.TemporaryDirectory(prefix="frames_") as frames_dir:
+        frame_paths = [
+            frame_path for _, _, frame_path in iter_detected_partitions(
+                nbim_file, custody_file, partitions, workers, chunksize, frames_dir=frames_dir
+            )
+        ]
+        return combine_partitions(frame_paths)
@@ -1,11 +1,9 @@
-import os
 import json
-import pandas as pd
-from anthropic import Anthropic
+from lib.llm_client import create_message
+from lib.model_routing import route_call
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-def build_prioritization_prompt(deviations: list, currencies: list, dates: list) -> dict:
+def build_prioritization_prompt(deviations: list, currencies: list, dates: list,
+                                recurrences: list | None = None) -> dict:
     """
     Build a prompt for the prioritization agent to rank dividend reconciliation issues.
     
@@ -13,6 +11,7 @@ def build_prioritization_prompt(deviations: list, currencies: list, dates: list)
         deviations: List of deviation amounts between NBIM and Custody
         currencies: List of corresponding settlement currencies
         dates: List of corresponding payment dates
+        recurrences: Optional list of how many earlier events had the same break (see BreakHistory.recurrences)
         
     Returns:
         dict: Message configuration for Anthropic API
@@ -26,6 +25,15 @@ def build_prioritization_prompt(deviations: list, currencies: list, dates: list)
             "currency": currency,
             "date": date
         })
+        if recurrences is not None:
+            issues_data[-1]["recurrences"] = recurrences[i]
+
+    recurrence_criterion = ""
+    if recurrences is not None:
+        recurrence_criterion = (
+            "\n    - Recurring breaks (recurrences = earlier events with the same ticker, issuer country, custodian "
+            "and break type) point to a systematic issue and should generally have higher priority"
+        )
     
     prompt_text = f"""
     You are a dividend reconciliation prioritization agent. Your task is to rank {len(deviations)} dividend reconciliation issues by priority (1 = highest priority, {len(deviations)} = lowest priority).
@@ -37,7 +45,7 @@ def build_prioritization_prompt(deviations: list, currencies: list, dates: list)
     - Higher deviation amounts should generally have higher priority
     - Older dates (further back in time) should generally have higher priority  
     - Consider currency impact as the deviation amount is in the settlement currency
-    - Balance urgency vs impact when making decisions
+    - Balance urgency vs impact when making decisions{recurrence_criterion}
 
     OUTPUT:
     Return ONLY a JSON array of priority rankings, where each number corresponds to the issue index.
@@ -56,57 +64,73 @@ def build_prioritization_prompt(deviations: list, currencies: list, dates: list)
         ],
     }
 
-def add_priorities_to_results(results: dict, model="claude-sonnet-4-20250514") -> dict:
+def add_priorities_to_results(results: list, model=None) -> list:
     """
-    Add priority column to results based on deviation, currency, and dates.
+    Add priority to each ResultRow based on deviation, currency, dates and, when any break
+    recurred, how often it recurred.
 
     """
     if not results:
         return results
     
-    deviations = []
-    currencies = []
-    dates = []
-    result_keys = []
+    deviations = [result.deviation for result in results]
+    currencies = [result.settlement_currency for result in results]
+    dates = [result.execution_date for result in results]
+    recurrences = [result.recurrences for result in results]
+    if not any(recurrences):
+        recurrences = None
     
-    for (coac_id, bank_account), data in results.items():
-        deviations.append(data['deviation'])
-        currencies.append(data['settlement_currency'])
-        dates.append(data['execution_date'])
-        result_keys.append((coac_id, bank_account))
+    priorities = _get_priorities_from_llm(deviations, currencies, dates, model, recurrences)
     
-    priorities = _get_priorities_from_llm(deviations, currencies, dates, model)
-    
-    for i, (coac_id, bank_account) in enumerate(result_keys):
+    for i, result in enumerate(results):
         if i < len(priorities):
-            results[(coac_id, bank_account)]['priority'] = priorities[i]
+            result.priority = priorities[i]
         else:
-            results[(coac_id, bank_account)]['priority'] = i + 1
+            result.priority = i + 1
     
     return results
 
-def _get_priorities_from_llm(deviations: list, currencies: list, dates: list, model: str) -> list:
-    """Get priority rankings from LLM."""
-    message_config = build_prioritization_prompt(deviations, currencies, dates)
-    
-    response = client.messages.create(
+def _get_priorities_from_llm(deviations: list, currencies: list, dates: list, model: str | None,
+                             recurrences: list | None = None) -> list:
+    """Get priority rankings from LLM, routed cheap-first unless a model is given."""
+    message_config = build_prioritization_prompt(deviations, currencies, dates, recurrences)
+
+    def validate(response_text, policy):
+        if _parse_priorities(response_text, len(deviations)) is None:
+            return "response is not a ranking of every issue"
+        return None
+
+    if model is not None:
+        response_text = _request_priorities(message_config, model)
+    else:
+        response_text = route_call(
+            "prioritization",
+            lambda routed_model: _request_priorities(message_config, routed_model),
+            validate,
+        )
+
+    priorities = _parse_priorities(response_text, len(deviations))
+    if priorities is None:
+        # Fallback: return simple ranking by deviation amount
+        return list(range(1, len(deviations) + 1))
+    print(f"Priorities: {priorities}")
+    return priorities
+
+def _request_priorities(message_config: dict, model: str) -> str:
+    response = create_message(
         model=model,
         max_tokens=300,
         system=message_config["system"],
         messages=message_config["messages"]
     )
     
-    response_text = "".join([block.text for block in response.content if getattr(block, "type", None) == "text"]).strip()
-    
+    return "".join([block.text for block in response.content if getattr(block, "type", None) == "text"]).strip()
+
+def _parse_priorities(response_text: str, expected_length: int) -> list | None:
     try:
-        # Parse JSON response
         priorities = json.loads(response_text)
-        if isinstance(priorities, list) and len(priorities) == len(deviations):
-            print(f"Priorities: {priorities}")
-            return priorities
-        else:
-            # Fallback: return simple ranking by deviation amount
-            return list(range(1, len(deviations) + 1))
     except json.JSONDecodeError:
-        # Fallback: return simple ranking by deviation amount
-        return list(range(1, len(deviations) + 1))
+        return None
+    if isinstance(priorities, list) and len(priorities) == expected_length:
+        return priorities
+    return None
@@ -0,0 +1,228 @@
+from collections.abc import Iterator
+from dataclasses import dataclass, field, fields
+
+import pandas as pd
+
+DEVIATION_TOLERANCE = 0.01
+
+# Conclusion of a break that was not resolved because another break of the event explains the deviation
+SKIPPED = 'SKIPPED'
+# Combined conclusion of an event whose breaks were resolved as NBIM_WRONG and CUSTODY_WRONG
+BOTH_WRONG = 'BOTH_WRONG'
+
+# Reference columns of the detected frame that are kept on the candidate, but not in its event values
+REFERENCE_COLUMNS = ('ISIN', 'CUSTODIAN')
+
+
+@dataclass(slots=True)
+class BreakCandidate:
+    """
+    An event whose net amounts deviate by more than the tolerance, built once from the detected frame.
+    values holds the event row for classification and is released once the event is classified.
+    """
+    pair: str | None
+    coac_id: object
+    bank_account: object
+    organisation_name: object
+    ticker: object
+    ex_date_cstd: object
+    settlement_currency: object
+    deviation: float
+    execution_date: str
+    issuer_country: str | None = None
+    custodian: str | None = None
+    values: dict = field(default_factory=dict, repr=False)
+
+    def get(self, column: str, default=None):
+        """Value of a column of the event row, like pd.Series.get."""
+        return self.values.get(column, default)
+
+
+@dataclass(slots=True)
+class ClassifiedBreak:
+    """One break of a candidate, as confirmed by the classification agent."""
+    candidate: BreakCandidate
+    break_index: int
+    break_type: str
+    explanation: str
+    explained_by: str | None = None
+    pattern: str | None = None
+
+    def to_payload(self) -> dict:
+        """JSON-ready representation for the work queue, without the full event row."""
+        payload = {
+            candidate_field.name: getattr(self.candidate, candidate_field.name)
+            for candidate_field in fields(BreakCandidate)
+            if candidate_field.name != 'values'
+        }
+        payload.update(
+            break_index=self.break_index, break_type=self.break_type, explanation=self.explanation,
+            explained_by=self.explained_by, pattern=self.pattern,
+        )
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "ClassifiedBreak":
+        candidate = BreakCandidate(**{
+            candidate_field.name: payload[candidate_field.name]
+            for candidate_field in fields(BreakCandidate)
+            if candidate_field.name != 'values'
+        })
+        return cls(
+            candidate, payload['break_index'], payload['break_type'], payload['explanation'],
+            payload.get('explained_by'), payload.get('pattern'),
+        )
+
+
+@dataclass(slots=True)
+class Resolution:
+    """Conclusion of a resolver agent for a classified break."""
+    classified_break: ClassifiedBreak
+    conclusion: str
+    explanation: str
+    reused: bool = False
+
+    @classmethod
+    def from_agent_result(cls, classified_break: ClassifiedBreak, agent_result: dict) -> "Resolution":
+        return cls(
+            classified_break,
+            agent_result.get('conclusion', 'NEED_INFO'),
+            agent_result.get('explanation', 'No explanation provided'),
+        )
+
+    @classmethod
+    def skipped(cls, classified_break: ClassifiedBreak) -> "Resolution":
+        return cls(
+            classified_break,
+            SKIPPED,
+            f"Not resolved: the net deviation is fully explained by the {classified_break.explained_by}",
+        )
+
+
+@dataclass(slots=True)
+class ResultRow:
+    """A row of the output file."""
+    coac_id: object
+    bank_account: object
+    conclusion: str
+    explanation: str
+    deviation: float
+    settlement_currency: object
+    execution_date: str
+    priority: object = 'N/A'
+    breaks: str = ''
+    recurrences: int = 0
+
+
+@dataclass(slots=True)
+class EventResult:
+    """The resolutions of every break of one event (coac_id, bank_account), in break order."""
+    candidate: BreakCandidate
+    resolutions: list = field(default_factory=list)
+
+    def add(self, resolution: Resolution) -> None:
+        self.resolutions.append(resolution)
+        self.resolutions.sort(key=lambda event_resolution: event_resolution.classified_break.break_index)
+
+    @property
+    def conclusion(self) -> str:
+        """
+        The shared conclusion when all resolved breaks agree, BOTH_WRONG when the breaks are
+        resolved as exactly NBIM_WRONG and CUSTODY_WRONG, and NEED_INFO otherwise (e.g. any
+        break needs information or has an unknown conclusion). Skipped breaks do not count.
+        """
+        conclusions = {resolution.conclusion for resolution in self.resolutions if resolution.conclusion != SKIPPED}
+        if len(conclusions) == 1:
+            return conclusions.pop()
+        if conclusions == {'NBIM_WRONG', 'CUSTODY_WRONG'}:
+            return BOTH_WRONG
+        return 'NEED_INFO'
+
+    @property
+    def explanation(self) -> str:
+        """The explanations of the resolved breaks, prefixed with their break type when there are several."""
+        resolved = [resolution for resolution in self.resolutions if resolution.conclusion != SKIPPED]
+        resolved = resolved or self.resolutions
+        if len(resolved) == 1:
+            return resolved[0].explanation
+        return " | ".join(
+            f"{resolution.classified_break.break_type}: {resolution.explanation}" for resolution in resolved
+        )
+
+    def to_result_row(self) -> ResultRow:
+        return ResultRow(
+            self.candidate.coac_id,
+            self.candidate.bank_account,
+            self.conclusion,
+            self.explanation,
+            self.candidate.deviation,
+            self.candidate.settlement_currency,
+            self.candidate.execution_date,
+            breaks="; ".join(
+                f"{resolution.classified_break.break_type}={resolution.conclusion}" for resolution in self.resolutions
+            ),
+        )
+
+
+def candidate_of(item) -> BreakCandidate | None:
+    """The candidate behind a candidate, classified break or resolution, or None for other items."""
+    if isinstance(item, Resolution):
+        item = item.classified_break
+    if isinstance(item, ClassifiedBreak):
+        item = item.candidate
+    return item if isinstance(item, BreakCandidate) else None
+
+
+RESULT_COLUMNS = [result_field.name for result_field in fields(ResultRow)]
+
+
+def results_to_frame(results: list) -> pd.DataFrame:
+    return pd.DataFrame.from_records(
+        [tuple(getattr(result, column) for column in RESULT_COLUMNS) for result in results],
+        columns=RESULT_COLUMNS,
+    )
+
+
+def _deviation(merged_df: pd.DataFrame) -> pd.Series:
+    return (merged_df['NET_AMOUNT_SETTLEMENT_CSTD'] - merged_df['NET_AMOUNT_SETTLEMENT_NBIM']).abs()
+
+def flag_break_rows(merged_df: pd.DataFrame, tolerance: float = DEVIATION_TOLERANCE) -> pd.DataFrame:
+    """
+    The rows whose net settlement amounts deviate by more than the tolerance (vectorized).
+    Rows where the deviation cannot be computed (e.g. unmatched rows) are kept, as before.
+    """
+    within_tolerance = _deviation(merged_df) / merged_df['NET_AMOUNT_SETTLEMENT_NBIM'] <= tolerance
+    return merged_df[~within_tolerance]
+
+def iter_break_candidates(merged_df: pd.DataFrame, pair=None,
+                          tolerance: float = DEVIATION_TOLERANCE) -> Iterator[BreakCandidate]:
+    """
+    Select the flagged events (see flag_break_rows) and yield one BreakCandidate per event
+    from a single pass of itertuples. A frame of flagged rows gives the same candidates.
+    Candidates are built as they are consumed, so only those waiting to be classified are in memory.
+    """
+    flagged = flag_break_rows(merged_df, tolerance)
+    if flagged.empty:
+        return
+
+    execution_dates = flagged['EX_DATE_CSTD'].dt.strftime('%Y-%m-%d').fillna("2024-01-01")
+    columns = list(flagged.columns)
+    for values, row_deviation, execution_date in zip(
+        flagged.itertuples(index=False, name=None), _deviation(flagged), execution_dates
+    ):
+        row = dict(zip(columns, values))
+        isin, custodian = (row.pop(column, None) for column in REFERENCE_COLUMNS)
+        yield BreakCandidate(
+            pair=pair,
+            coac_id=row['COAC_EVENT_KEY'],
+            bank_account=row['CUSTODY'],
+            organisation_name=row['ORGANISATION_NAME'],
+            ticker=row['TICKER'],
+            ex_date_cstd=row['EX_DATE_CSTD'],
+            settlement_currency=row['SETTLEMENT_CURRENCY_CSTD'],
+            deviation=row_deviation,
+            execution_date=execution_date,
+            issuer_country=isin[:2] if isinstance(isin, str) else None,
+            custodian=custodian if isinstance(custodian, str) else None,
+            values=row,
+        )
@@ -0,0 +1,63 @@
+import hashlib
+import io
+import math
+import os
+import pandas as pd
+
+FILTER_COLUMNS = {
+    'conclusion': 'conclusion',
+    'currency': 'settlement_currency',
+    'custody_account': 'bank_account',
+}
+
+def file_signature(path: str) -> tuple | None:
+    """Cheap change marker for the output file: (mtime in ns, size), or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def load_results(path: str) -> tuple:
+    """
+    Load the output file once, sorted by priority (1 = highest priority).
+    Returns the frame and the SHA-256 digest of the file content, which identifies
+    the version of the results for caching filtered views and downloads.
+    """
+    with open(path, 'rb') as output_file:
+        content = output_file.read()
+    output_df = pd.read_csv(io.BytesIO(content))
+
+    if 'priority' in output_df.columns:
+        output_df['priority_numeric'] = pd.to_numeric(output_df['priority'], errors='coerce')
+        output_df = output_df.sort_values('priority_numeric', ascending=True, kind='stable')
+        output_df = output_df.drop('priority_numeric', axis=1).reset_index(drop=True)
+
+    return output_df, hashlib.sha256(content).hexdigest()
+
+def filter_options(output_df: pd.DataFrame) -> dict:
+    """Sorted distinct values per filter, e.g. {'conclusion': ['NBIM_WRONG', ...], ...}."""
+    return {
+        name: sorted(output_df[column].dropna().unique().tolist(), key=str)
+        for name, column in FILTER_COLUMNS.items()
+        if column in output_df.columns
+    }
+
+def filter_results(output_df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """Keep rows matching every non-empty filter, e.g. {'conclusion': ['NBIM_WRONG'], 'currency': []}."""
+    mask = pd.Series(True, index=output_df.index)
+    for name, values in filters.items():
+        column = FILTER_COLUMNS[name]
+        if values and column in output_df.columns:
+            mask &= output_df[column].isin(values)
+    return output_df[mask] if not mask.all() else output_df
+
+def count_pages(row_count: int, page_size: int) -> int:
+    return max(1, math.ceil(row_count / page_size))
+
+def paginate(output_df: pd.DataFrame, page: int, page_size: int) -> tuple:
+    """Return the rows of the (1-based) page and the number of pages."""
+    page_count = count_pages(len(output_df), page_size)
+    page = min(max(page, 1), page_count)
+    start = (page - 1) * page_size
+    return output_df.iloc[start:start + page_size], page_count
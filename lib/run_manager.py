@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from lib.records import candidate_of
+
+# Stages whose items count towards progress, besides the resolve:<break type> stages
+TRACKED_STAGES = ("classify", "collect", "prioritize")
+
+
+class ReconciliationRun:
+    """State of one background reconciliation run, updated from the stage graph events."""
+
+    def __init__(self, run_id: str, max_events: int = 500):
+        self.run_id = run_id
+        self.status = "running"
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.events = deque(maxlen=max_events)
+        self.queued = 0
+        self.done = 0
+        self.failed = 0
+        self.stage_errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self.status == "running"
+
+    @property
+    def progress(self) -> float:
+        """Share of queued row and break items that are classified, resolved or failed, at most 1.0."""
+        with self._lock:
+            return min(1.0, (self.done + self.failed) / self.queued) if self.queued else 0.0
+
+    def record_event(self, event: dict) -> None:
+        """Translate a stage graph event into a per-row progress event."""
+        stage, status, item = event["stage"], event["status"], event["item"]
+        # on_close failures (item None) were never queued, so they are reported but not counted
+        tracked = item is not None and (stage in TRACKED_STAGES or stage.startswith("resolve:"))
+        candidate = candidate_of(item)
+        message = None
+
+        if status == "failed":
+            message = f"Failed in {stage}: {event['error']}"
+            if candidate is not None:
+                message = f"Failed {candidate.coac_id} / {candidate.bank_account} in {stage}: {event['error']}"
+        elif status == "completed" and stage == "classify":
+            message = f"Classified {candidate.coac_id} / {candidate.bank_account} ({candidate.ticker})"
+        elif status == "completed" and stage == "collect":
+            message = (
+                f"Resolved {item.classified_break.break_type} for {candidate.coac_id} / "
+                f"{candidate.bank_account}: {item.conclusion}"
+            )
+
+        with self._lock:
+            if status == "failed":
+                self.stage_errors += 1
+            if tracked and status == "queued":
+                self.queued += 1
+            elif tracked and status == "completed":
+                self.done += 1
+            elif tracked and status == "failed":
+                self.failed += 1
+            if message:
+                self.events.append((time.time(), status, message))
+
+    def recent_events(self, limit: int = 50) -> list:
+        with self._lock:
+            return list(self.events)[-limit:][::-1]
+
+    def _finish(self, status: str, error: str | None = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+
+
+class RunManager:
+    """
+    Runs reconciliations in background threads so the dashboard stays responsive.
+    Runs are kept by run id, so a page can reattach to a running job after a refresh.
+    """
+
+    def __init__(self):
+        self.runs = {}
+        self._lock = threading.Lock()
+
+    def start(self, target, *args, **kwargs) -> ReconciliationRun:
+        """Start target(*args, on_event=..., cancel_event=..., **kwargs) in a background thread."""
+        run = ReconciliationRun(uuid.uuid4().hex[:12])
+        with self._lock:
+            self.runs[run.run_id] = run
+
+        def execute():
+            try:
+                target(*args, on_event=run.record_event, cancel_event=run.cancel_event, **kwargs)
+            except Exception as e:
+                run._finish("failed", str(e))
+            else:
+                if run.cancel_event.is_set():
+                    run._finish("cancelled")
+                elif run.stage_errors:
+                    run._finish("failed", f"{run.stage_errors} step(s) failed, see the progress events")
+                else:
+                    run._finish("completed")
+
+        threading.Thread(target=execute, name=f"reconciliation-{run.run_id}", daemon=True).start()
+        return run
+
+    def get(self, run_id: str | None) -> ReconciliationRun | None:
+        with self._lock:
+            return self.runs.get(run_id)
+
+    def active_run(self) -> ReconciliationRun | None:
+        with self._lock:
+            running = [run for run in self.runs.values() if run.is_running]
+        return running[-1] if running else None
+
+    def cancel(self, run_id: str) -> None:
+        run = self.get(run_id)
+        if run is not None:
+            run.cancel_event.set()
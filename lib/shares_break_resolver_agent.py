@@ -1,8 +1,6 @@
-import os
 import json
-from anthropic import Anthropic
-
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from lib.llm_client import create_message
+from lib.model_routing import route_call, validate_json_resolution
 
 SHARES_AGENT_TOOLS = [
     {
@@ -49,10 +47,13 @@ def build_shares_agent_prompt(classifier_explanation: str, organisation_name: st
     - NBIM's expected position is wrong, or
     - There is not enough information to decide (NEED_INFO).
     
+    Set confidence to LOW if the evidence only partially supports your conclusion, otherwise HIGH.
+
     OUTPUT:
-    Always return a valid JSON object with exactly these two fields, without any other text such as '''json''':
+    Always return a valid JSON object with exactly these three fields, without any other text such as '''json''':
     {{
     "conclusion": "NEED_INFO | CUSTODY_WRONG | NBIM_WRONG",
+    "confidence": "HIGH | LOW",
     "explanation": "Self-contained, operator-ready summary that does not assume any prior context. 
     Include the relevant input data provided to you, as well as any additional facts you retrieved using tools. 
     Clearly state why these values lead you to the chosen conclusion. Be concise, factual, and avoid speculation."
@@ -104,12 +105,25 @@ def _execute_tool(tool_name: str, tool_args: dict) -> dict:
     
     return {}
  
-def resolve_shares_break(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model="claude-sonnet-4-20250514") -> str:
+def resolve_shares_break(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model=None) -> str:
+    """
+    Resolve the break. Without an explicit model the call is routed cheap-first and
+    escalated on invalid output, NEED_INFO or LOW confidence.
+    """
+    if model is not None:
+        return _request_shares_resolution(classifier_explanation, organisation_name, ticker, ex_date_cstd, model)
+    return route_call(
+        "shares",
+        lambda routed_model: _request_shares_resolution(classifier_explanation, organisation_name, ticker, ex_date_cstd, routed_model),
+        validate_json_resolution,
+    )
+
+def _request_shares_resolution(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model: str) -> str:
 
     message_config = build_shares_agent_prompt(classifier_explanation, organisation_name, ticker, ex_date_cstd)
     conversation = message_config["messages"].copy()
     
-    response = client.messages.create(
+    response = create_message(
         model=model,
         max_tokens=1000,
         tools=SHARES_AGENT_TOOLS,
@@ -136,7 +150,7 @@ def resolve_shares_break(classifier_explanation: str, organisation_name: str, ti
                 "content": [{"type": "tool_result", "tool_use_id": tool_call.id, "content": json.dumps(tool_result)}]
             })
         
-        response = client.messages.create(
+        response = create_message(
             model=model,
             max_tokens=600,
             tools=SHARES_AGENT_TOOLS,
@@ -0,0 +1,140 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class Stage:
+    """A node in the stage graph with its own bounded queue and worker pool."""
+
+    def __init__(self, name: str, handler, workers: int = 1, max_queue: int = 16, downstream=(), on_close=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.downstream = set(downstream)
+        self.on_close = on_close
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.threads = []
+
+
+class StageGraph:
+    """
+    Small dataflow scheduler.
+
+    Each stage handler is called as handler(item, emit) by one of the stage's workers and
+    passes any number of items on with emit(stage_name, item). Queues are bounded, so a
+    slow stage blocks its upstream stages (backpressure). Stages are closed in topological
+    order once all their upstream stages are closed and their queue is drained; on_close
+    can then emit aggregated items downstream (e.g. prioritization after all resolutions).
+
+    on_event(event) is called with {"stage", "status", "item", "error"} whenever an item
+    is queued, completed or failed in a stage. Setting cancel_event cancels the run.
+    """
+
+    def __init__(self, on_event=None, cancel_event: threading.Event | None = None):
+        self.stages = {}
+        self.errors = []
+        self.on_event = on_event
+        self.cancelled = cancel_event or threading.Event()
+        self._errors_lock = threading.Lock()
+
+    def add_stage(self, name: str, handler, workers: int = 1, max_queue: int = 16, downstream=(), on_close=None) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Stage already exists: {name}")
+        stage = Stage(name, handler, workers, max_queue, downstream, on_close)
+        self.stages[name] = stage
+        return stage
+
+    def has_stage(self, name: str) -> bool:
+        return name in self.stages
+
+    def cancel(self) -> None:
+        """Stop scheduling new work. Items already being handled run to completion."""
+        self.cancelled.set()
+
+    def run(self, entry_stage: str, items) -> list:
+        """Feed items into the entry stage, run the graph until it is drained and return the errors."""
+        order = self._topological_order()
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage,), name=f"{stage.name}-worker", daemon=True)
+                thread.start()
+                stage.threads.append(thread)
+
+        for item in items:
+            if self.cancelled.is_set():
+                break
+            self._notify(entry_stage, "queued", item)
+            self.stages[entry_stage].queue.put(item)
+
+        for name in order:
+            self._close(self.stages[name])
+
+        return self.errors
+
+    def _emitter(self, source: Stage):
+        def emit(stage_name: str, item) -> None:
+            if stage_name not in source.downstream:
+                raise ValueError(f"Stage {source.name} is not connected to {stage_name}")
+            if self.cancelled.is_set():
+                return
+            self._notify(stage_name, "queued", item)
+            self.stages[stage_name].queue.put(item)
+        return emit
+
+    def _work(self, stage: Stage) -> None:
+        emit = self._emitter(stage)
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                stage.queue.task_done()
+                return
+            try:
+                if not self.cancelled.is_set():
+                    stage.handler(item, emit)
+                    self._notify(stage.name, "completed", item)
+            except Exception as e:
+                print(f"Stage {stage.name} failed: {e}")
+                with self._errors_lock:
+                    self.errors.append((stage.name, item, e))
+                self._notify(stage.name, "failed", item, e)
+            finally:
+                stage.queue.task_done()
+
+    def _close(self, stage: Stage) -> None:
+        stage.queue.join()
+        for _ in stage.threads:
+            stage.queue.put(_STOP)
+        for thread in stage.threads:
+            thread.join()
+        if stage.on_close and not self.cancelled.is_set():
+            try:
+                stage.on_close(self._emitter(stage))
+            except Exception as e:
+                print(f"Stage {stage.name} failed on close: {e}")
+                with self._errors_lock:
+                    self.errors.append((stage.name, None, e))
+                self._notify(stage.name, "failed", None, e)
+
+    def _notify(self, stage_name: str, status: str, item, error=None) -> None:
+        if self.on_event:
+            self.on_event({"stage": stage_name, "status": status, "item": item, "error": error})
+
+    def _topological_order(self) -> list:
+        incoming = {name: 0 for name in self.stages}
+        for stage in self.stages.values():
+            for target in stage.downstream:
+                if target not in self.stages:
+                    raise ValueError(f"Stage {stage.name} is connected to unknown stage {target}")
+                incoming[target] += 1
+
+        order = [name for name, count in incoming.items() if count == 0]
+        for name in order:
+            for target in sorted(self.stages[name].downstream):
+                incoming[target] -= 1
+                if incoming[target] == 0:
+                    order.append(target)
+
+        if len(order) != len(self.stages):
+            raise ValueError("Stage graph contains a cycle")
+        return order
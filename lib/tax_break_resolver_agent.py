@@ -1,8 +1,6 @@
-import os
 import json
-from anthropic import Anthropic
-
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from lib.llm_client import create_message
+from lib.model_routing import route_call, validate_json_resolution
 
 TAX_RESEARCH_TOOLS = [{"type": "web_search_20250305", "name": "web_search"}]
 
@@ -36,12 +34,15 @@ def build_tax_agent_prompt(classifier_explanation: str, organisation_name: str,
     - Do NOT rely on outdated, speculative, or unreliable internet sources.
     - It is always better to conclude NEED_INFO than to give a wrong answer.
 
+    Set confidence to LOW if the evidence only partially supports your conclusion, otherwise HIGH.
+
     OUTPUT:
-    Always return ONLY avalid JSON object with exactly these two fields, without any other text such as '''json'''.
+    Always return ONLY avalid JSON object with exactly these three fields, without any other text such as '''json'''.
     Do not include any reasoning from a potential web search outside of the explanation field in the json.
     This is the ONLY output format you are allowed to use:
     {{
     "conclusion": "NEED_INFO | CUSTODY_WRONG | NBIM_WRONG",
+    "confidence": "HIGH | LOW",
     "explanation": "Self-contained, operator-ready summary that does not assume any prior context. 
     Include the relevant input data provided to you, as well as any additional facts you retrieved using tools. 
     Clearly state why these values lead you to the chosen conclusion. Be concise, factual, and avoid speculation."
@@ -57,12 +58,25 @@ def build_tax_agent_prompt(classifier_explanation: str, organisation_name: str,
         ],
     }
 
-def resolve_tax_break(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model="claude-sonnet-4-20250514") -> str:
+def resolve_tax_break(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model=None) -> str:
+    """
+    Resolve the break. Without an explicit model the call is routed cheap-first and
+    escalated on invalid output, NEED_INFO or LOW confidence.
+    """
+    if model is not None:
+        return _request_tax_resolution(classifier_explanation, organisation_name, ticker, ex_date_cstd, model)
+    return route_call(
+        "tax",
+        lambda routed_model: _request_tax_resolution(classifier_explanation, organisation_name, ticker, ex_date_cstd, routed_model),
+        validate_json_resolution,
+    )
+
+def _request_tax_resolution(classifier_explanation: str, organisation_name: str, ticker: str, ex_date_cstd: str, model: str) -> str:
 
     message_config = build_tax_agent_prompt(classifier_explanation, organisation_name, ticker, ex_date_cstd)
     conversation = message_config["messages"].copy()
     
-    response = client.messages.create(
+    response = create_message(
         model=model,
         max_tokens=600,
         tools=TAX_RESEARCH_TOOLS,
@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    leased_by TEXT,
+    lease_expires_at REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_lease ON tasks(status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_run_status ON tasks(run_id, status);
+"""
+
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class WorkQueue:
+    """
+    Durable task queue in a local SQLite file, shared by any number of worker processes.
+
+    A leased task is invisible to other workers until its visibility timeout expires, which the
+    worker holding it restarts with extend_lease while it is still working on the task.
+    Tasks that fail, or whose lease expires, are retried until max_attempts and are then
+    marked dead. Statuses: pending, leased, done, dead.
+    SQLite locking is only reliable on local disks and network filesystems with working
+    POSIX locks, so hosts sharing a queue must mount it from such a filesystem.
+    """
+
+    def __init__(self, path: str, visibility_timeout_s: float = 900, max_attempts: int = 3):
+        self.path = path
+        self.visibility_timeout_s = visibility_timeout_s
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def create_run(self, run_id: str | None = None) -> str:
+        run_id = run_id or uuid.uuid4().hex[:12]
+        try:
+            with self._transaction() as connection:
+                connection.execute("INSERT INTO runs (run_id, created_at) VALUES (?, ?)", (run_id, time.time()))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Run already exists: {run_id}") from None
+        return run_id
+
+    def seal_run(self, run_id: str) -> None:
+        """Mark that all tasks of the run have been enqueued."""
+        with self._transaction() as connection:
+            connection.execute("UPDATE runs SET sealed = 1 WHERE run_id = ?", (run_id,))
+
+    def enqueue(self, run_id: str, payload: dict) -> int:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO tasks (run_id, payload, updated_at) VALUES (?, ?, ?)",
+                (run_id, json.dumps(payload, default=_json_default), time.time()),
+            )
+            return cursor.lastrowid
+
+    def _expire_exhausted_leases(self, connection, now: float, run_id: str | None = None) -> None:
+        """Mark expired leases that used up their attempts as dead, since they will never be retried."""
+        run_filter = " AND run_id = ?" if run_id is not None else ""
+        connection.execute(
+            "UPDATE tasks SET status = 'dead', error = COALESCE(error, 'Lease expired'), updated_at = ? "
+            f"WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?{run_filter}",
+            (now, now, self.max_attempts, *([run_id] if run_id is not None else [])),
+        )
+
+    def lease(self, worker_id: str) -> dict | None:
+        """Lease the oldest available task, or return None when there is nothing to do."""
+        now = time.time()
+        with self._transaction() as connection:
+            self._expire_exhausted_leases(connection, now)
+            row = connection.execute(
+                "SELECT task_id, run_id, payload, attempts FROM tasks "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires_at < ?) "
+                "ORDER BY task_id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, leased_by = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE task_id = ?",
+                (worker_id, now + self.visibility_timeout_s, now, row["task_id"]),
+            )
+        return {
+            "task_id": row["task_id"],
+            "run_id": row["run_id"],
+            "payload": json.loads(row["payload"]),
+            "attempt": row["attempts"] + 1,
+        }
+
+    def extend_lease(self, task_id: int, worker_id: str) -> bool:
+        """
+        Restart the visibility timeout of a task the worker still holds, so a long resolution
+        is not leased again by another worker. Returns False if the lease was already lost.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET lease_expires_at = ?, updated_at = ? "
+                "WHERE task_id = ? AND status = 'leased' AND leased_by = ?",
+                (now + self.visibility_timeout_s, now, task_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id: int, worker_id: str, result: dict) -> bool:
+        """Post the result of a leased task. Returns False if the lease was lost to another worker."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'done', result = ?, updated_at = ? "
+                "WHERE task_id = ? AND status = 'leased' AND leased_by = ?",
+                (json.dumps(result, default=_json_default), time.time(), task_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id: int, worker_id: str, error: str) -> None:
+        """Release a failed task for retry, or mark it dead when it has no attempts left."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, "
+                "error = ?, leased_by = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE task_id = ? AND status = 'leased' AND leased_by = ?",
+                (self.max_attempts, error, time.time(), task_id, worker_id),
+            )
+
+    def run_status(self, run_id: str) -> dict:
+        """
+        Return task counts per status and whether the run is sealed and finished. Expired leases
+        without attempts left are marked dead first, so a run finishes even when no worker is left.
+        """
+        with self._transaction() as connection:
+            run = connection.execute("SELECT sealed FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run is None:
+                raise KeyError(f"Unknown run: {run_id}")
+            self._expire_exhausted_leases(connection, time.time(), run_id)
+            counts = {
+                row["status"]: row["count"]
+                for row in connection.execute(
+                    "SELECT status, COUNT(*) AS count FROM tasks WHERE run_id = ? GROUP BY status", (run_id,)
+                )
+            }
+        sealed = bool(run["sealed"])
+        return {
+            "sealed": sealed,
+            "counts": counts,
+            "finished": sealed and not counts.get("pending") and not counts.get("leased"),
+        }
+
+    def run_tasks(self, run_id: str) -> list:
+        """Return payload, status, result and error of every task of the run, in enqueue order."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT task_id, payload, status, result, error FROM tasks WHERE run_id = ? ORDER BY task_id",
+                (run_id,),
+            ).fetchall()
+        return [
+            {
+                "task_id": row["task_id"],
+                "payload": json.loads(row["payload"]),
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+from app import BREAK_RESOLVERS
+from lib.break_aggregation import EXPLAINED_TOLERANCE, explained_deviation, mark_explained_breaks
+from lib.data_preparation import process_data
+from lib.discrepancy_detection import detect_all_discrepancies
+from lib.records import (
+    BOTH_WRONG, SKIPPED, BreakCandidate, ClassifiedBreak, EventResult, Resolution, iter_break_candidates
+)
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture(scope="module")
+def sample_candidates():
+    merged_df = detect_all_discrepancies(process_data(
+        os.path.join(DATA_FOLDER, "NBIM_Dividend_Bookings.csv"),
+        os.path.join(DATA_FOLDER, "CUSTODY_Dividend_Bookings.csv"),
+    ))
+    return {candidate.coac_id: candidate for candidate in iter_break_candidates(merged_df)}
+
+
+def _candidate(**values) -> BreakCandidate:
+    """An event with a custody net settlement amount of 110 against 100 at NBIM, and no other difference."""
+    event = {
+        'NET_AMOUNT_SETTLEMENT_NBIM': 100.0, 'NET_AMOUNT_SETTLEMENT_CSTD': 110.0,
+        'NET_AMOUNT_QUOTATION_NBIM': 100.0,
+        'GROSS_AMOUNT_QUOTATION_NBIM': 100.0, 'GROSS_AMOUNT_QUOTATION_CSTD': 100.0,
+        'TOTAL_TAX_QUOTATION_NBIM': 0.0, 'TOTAL_TAX_QUOTATION_CSTD': 0.0,
+        'DIV_RATE_NBIM': 1.0, 'DIV_RATE_CSTD': 1.0,
+        'FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD': 1.0,
+    }
+    event.update(values)
+    return BreakCandidate(
+        pair=None, coac_id=1, bank_account=2, organisation_name="Org", ticker="TICK", ex_date_cstd=None,
+        settlement_currency="USD", deviation=10.0, execution_date="2025-01-01", values=event,
+    )
+
+
+def _breaks(candidate, *break_types) -> list:
+    return [ClassifiedBreak(candidate, index, break_type, "") for index, break_type in enumerate(break_types)]
+
+
+def test_shares_break_explains_sample_event(sample_candidates):
+    candidate = sample_candidates[970456789]
+    assert explained_deviation(candidate, "Shares Break") == pytest.approx(4030.00, abs=0.01)
+
+    classified_breaks = _breaks(candidate, "DPS Break", "Shares Break", "FX Break")
+    mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+    assert [classified_break.explained_by for classified_break in classified_breaks] == [
+        "Shares Break", None, "Shares Break"
+    ]
+
+
+def test_tax_break_explains_sample_event(sample_candidates):
+    candidate = sample_candidates[960789012]
+    # The tax difference is converted from the quotation to the settlement currency
+    assert explained_deviation(candidate, "Tax Break") == pytest.approx(342.77, rel=EXPLAINED_TOLERANCE)
+
+    classified_breaks = _breaks(candidate, "FX Break", "Tax Break")
+    mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+    assert [classified_break.explained_by for classified_break in classified_breaks] == ["Tax Break", None]
+
+
+def test_impact_has_the_sign_of_the_net_deviation():
+    assert explained_deviation(_candidate(DIV_RATE_CSTD=1.1), "DPS Break") == pytest.approx(10.0)
+    assert explained_deviation(
+        _candidate(NET_AMOUNT_SETTLEMENT_CSTD=90.0, DIV_RATE_CSTD=0.9), "DPS Break"
+    ) == pytest.approx(-10.0)
+    assert explained_deviation(_candidate(TOTAL_TAX_QUOTATION_NBIM=10.0), "Tax Break") == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize("explaining_values,break_type", [
+    ({'DIV_RATE_CSTD': 1.1}, "DPS Break"),
+    ({'FX_RATE_QUOTATION_TO_SETTLEMENT_CSTD': 100.0 / 110.0}, "FX Break"),
+])
+def test_break_without_resolver_does_not_explain_others(explaining_values, break_type):
+    candidate = _candidate(**explaining_values)
+    assert explained_deviation(candidate, break_type) == pytest.approx(10.0)
+
+    classified_breaks = _breaks(candidate, break_type, "Tax Break")
+    mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+    assert all(classified_break.explained_by is None for classified_break in classified_breaks)
+
+    mark_explained_breaks(candidate, classified_breaks, [break_type])
+    assert classified_breaks[1].explained_by == break_type
+
+
+def test_no_break_is_explained_when_none_accounts_for_the_deviation():
+    candidate = _candidate(DIV_RATE_CSTD=1.05)
+    classified_breaks = _breaks(candidate, "Tax Break", "Shares Break")
+    mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+    assert all(classified_break.explained_by is None for classified_break in classified_breaks)
+
+
+def test_single_break_is_never_explained():
+    candidate = _candidate(TOTAL_TAX_QUOTATION_NBIM=10.0)
+    classified_breaks = _breaks(candidate, "Tax Break")
+    mark_explained_breaks(candidate, classified_breaks, BREAK_RESOLVERS)
+    assert classified_breaks[0].explained_by is None
+
+
+def _event_conclusion(*conclusions) -> str:
+    candidate = _candidate()
+    event = EventResult(candidate)
+    for classified_break, conclusion in zip(_breaks(candidate, *["Tax Break"] * len(conclusions)), conclusions):
+        event.add(Resolution(classified_break, conclusion, ""))
+    return event.conclusion
+
+
+@pytest.mark.parametrize("conclusions,expected", [
+    (("NBIM_WRONG",), "NBIM_WRONG"),
+    (("CUSTODY_WRONG", "CUSTODY_WRONG"), "CUSTODY_WRONG"),
+    (("NBIM_WRONG", "CUSTODY_WRONG"), BOTH_WRONG),
+    (("CUSTODY_WRONG", "NBIM_WRONG", "NBIM_WRONG"), BOTH_WRONG),
+    (("NBIM_WRONG", "NEED_INFO"), "NEED_INFO"),
+    (("NBIM_WRONG", "CUSTODY_WRONG", "NEED_INFO"), "NEED_INFO"),
+    (("NBIM_WRONG", "UNEXPECTED"), "NEED_INFO"),
+    (("NBIM_WRONG", SKIPPED), "NBIM_WRONG"),
+    (("NBIM_WRONG", SKIPPED, "CUSTODY_WRONG"), BOTH_WRONG),
+    ((SKIPPED,), "NEED_INFO"),
+    ((), "NEED_INFO"),
+])
+def test_event_conclusion(conclusions, expected):
+    assert _event_conclusion(*conclusions) == expected
+
+
+def test_event_explanation_ignores_skipped_breaks():
+    candidate = _candidate()
+    tax_break, shares_break = _breaks(candidate, "Tax Break", "Shares Break")
+    shares_break.explained_by = "Tax Break"
+    event = EventResult(candidate)
+    event.add(Resolution.skipped(shares_break))
+    event.add(Resolution(tax_break, "CUSTODY_WRONG", "Custody applied the wrong rate"))
+
+    assert event.explanation == "Custody applied the wrong rate"
+    assert event.to_result_row().breaks == "Tax Break=CUSTODY_WRONG; Shares Break=SKIPPED"
@@ -0,0 +1,118 @@
+import pytest
+
+from lib.break_history import BreakHistory
+from lib.records import SKIPPED, BreakCandidate, ClassifiedBreak, Resolution
+
+TAX_PATTERN = "tax_rate 0.2500 vs 0.1500"
+
+
+@pytest.fixture
+def history(tmp_path):
+    return BreakHistory(str(tmp_path / "break_history.db"))
+
+
+def _break(coac_id, break_type="Tax Break", pattern=TAX_PATTERN, break_index=0, ticker="SAMSUNG") -> ClassifiedBreak:
+    candidate = BreakCandidate(
+        pair=None, coac_id=coac_id, bank_account=712345678, organisation_name="Samsung Electronics",
+        ticker=ticker, ex_date_cstd=None, settlement_currency="KRW", deviation=100.0,
+        execution_date="2025-03-31", issuer_country="KR", custodian="HSBC_KOREA",
+    )
+    return ClassifiedBreak(candidate, break_index, break_type, "", pattern=pattern)
+
+
+def _record(history, coac_id, conclusion, recorded_at, reused=False, **break_fields) -> None:
+    resolution = Resolution(_break(coac_id, **break_fields), conclusion, f"{conclusion} for {coac_id}", reused=reused)
+    history.record([resolution], recorded_at=recorded_at)
+
+
+def test_conclusion_is_reused_after_two_agreeing_agent_conclusions(history):
+    _record(history, 1, "CUSTODY_WRONG", recorded_at=1)
+    assert history.find_reusable(_break(3)) is None
+
+    _record(history, 2, "CUSTODY_WRONG", recorded_at=2)
+    assert history.find_reusable(_break(3))["coac_id"] == "2"
+
+    reused = history.reuse(_break(3))
+    assert reused.conclusion == "CUSTODY_WRONG"
+    assert reused.reused
+    assert "event 2 / 712345678" in reused.explanation
+
+
+def test_min_matches(history):
+    _record(history, 1, "NBIM_WRONG", recorded_at=1)
+    assert history.find_reusable(_break(3), min_matches=1)["conclusion"] == "NBIM_WRONG"
+    _record(history, 2, "NBIM_WRONG", recorded_at=2)
+    assert history.find_reusable(_break(3), min_matches=3) is None
+
+
+def test_conclusions_must_agree_within_the_lookback(history):
+    _record(history, 1, "NBIM_WRONG", recorded_at=1)
+    _record(history, 2, "CUSTODY_WRONG", recorded_at=2)
+    _record(history, 3, "CUSTODY_WRONG", recorded_at=3)
+    assert history.find_reusable(_break(9)) is None
+    # The disagreeing conclusion is older than the last two
+    assert history.find_reusable(_break(9), lookback=2)["conclusion"] == "CUSTODY_WRONG"
+
+
+def test_need_info_is_never_reused(history):
+    _record(history, 1, "NEED_INFO", recorded_at=1)
+    _record(history, 2, "NEED_INFO", recorded_at=2)
+    assert history.find_reusable(_break(3)) is None
+
+
+def test_reused_and_skipped_conclusions_do_not_count(history):
+    _record(history, 1, "CUSTODY_WRONG", recorded_at=1)
+    _record(history, 2, "CUSTODY_WRONG", recorded_at=2, reused=True)
+    _record(history, 3, SKIPPED, recorded_at=3)
+    assert history.find_reusable(_break(4)) is None
+
+
+def test_same_event_does_not_count(history):
+    _record(history, 1, "CUSTODY_WRONG", recorded_at=1)
+    _record(history, 2, "CUSTODY_WRONG", recorded_at=2)
+    assert history.find_reusable(_break(2)) is None
+
+
+def test_shares_breaks_are_never_reused(history):
+    for coac_id in (1, 2):
+        _record(history, coac_id, "NBIM_WRONG", recorded_at=coac_id, break_type="Shares Break",
+                pattern="shares_ratio 1.0500")
+    assert history.find_reusable(_break(3, "Shares Break", "shares_ratio 1.0500"), min_matches=1) is None
+
+
+@pytest.mark.parametrize("probe_fields", [
+    {"pattern": "tax_rate 0.2500 vs 0.2000"},
+    {"pattern": None},
+    {"ticker": "LG"},
+])
+def test_only_identical_breaks_are_reused(history, probe_fields):
+    for coac_id in (1, 2):
+        _record(history, coac_id, "CUSTODY_WRONG", recorded_at=coac_id)
+    assert history.find_reusable(_break(3, **probe_fields)) is None
+
+
+def test_breaks_of_the_same_type_in_one_event_are_kept(history):
+    history.record([
+        Resolution(_break(1, "Other Break", None, break_index=0), "NEED_INFO", "first"),
+        Resolution(_break(1, "Other Break", None, break_index=1), "NEED_INFO", "second"),
+    ])
+    assert sorted(row["explanation"] for row in history.find(break_type="Other Break")) == ["first", "second"]
+
+
+def test_recording_an_event_again_replaces_its_rows(history):
+    history.record([
+        Resolution(_break(1, "Tax Break", break_index=0), "CUSTODY_WRONG", "tax"),
+        Resolution(_break(1, "Shares Break", None, break_index=1), "NBIM_WRONG", "shares"),
+    ])
+    history.record([Resolution(_break(1, "Shares Break", None, break_index=0), "NBIM_WRONG", "rerun")])
+    assert [row["explanation"] for row in history.find(ticker="SAMSUNG")] == ["rerun"]
+
+
+def test_recurrences_count_other_events(history):
+    history.record([
+        Resolution(_break(1, "Other Break", None, break_index=0), "NEED_INFO", ""),
+        Resolution(_break(1, "Other Break", None, break_index=1), "NEED_INFO", ""),
+        Resolution(_break(2, "Other Break", None), "NEED_INFO", ""),
+    ])
+    assert history.recurrences(_break(3).candidate, ["Other Break", "Tax Break"]) == 2
+    assert history.recurrences(_break(2).candidate, ["Other Break"]) == 1
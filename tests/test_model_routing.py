@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from lib.model_routing import (
+    LARGE_MODEL, ROUTING_POLICIES, SMALL_MODEL, get_routing_metrics, reset_routing_metrics, route_call,
+    validate_json_classification, validate_json_resolution,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    reset_routing_metrics()
+    yield
+    reset_routing_metrics()
+
+
+def _resolution(conclusion="CUSTODY_WRONG", confidence="HIGH", explanation="Custody applied the wrong rate") -> str:
+    return json.dumps({"conclusion": conclusion, "confidence": confidence, "explanation": explanation})
+
+
+def _stub(*responses):
+    """A call(model) that returns (or raises) the responses in order and records the models it got."""
+    models = []
+    responses = list(responses)
+
+    def call(model):
+        models.append(model)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return call, models
+
+
+def test_valid_cheap_response_is_not_escalated():
+    call, models = _stub(_resolution())
+    assert route_call("tax", call, validate_json_resolution) == _resolution()
+    assert models == [SMALL_MODEL]
+    assert get_routing_metrics()["tax"][SMALL_MODEL]["escalations"] == 0
+
+
+@pytest.mark.parametrize("cheap_response", [
+    "not json",
+    json.dumps({"explanation": "no conclusion"}),
+    json.dumps({"conclusion": "MAYBE", "explanation": "unknown conclusion"}),
+    _resolution(explanation=""),
+    _resolution(conclusion="NEED_INFO"),
+    _resolution(confidence="low"),
+])
+def test_resolution_escalates_to_large_model(cheap_response):
+    call, models = _stub(cheap_response, _resolution("NBIM_WRONG"))
+    assert route_call("tax", call, validate_json_resolution) == _resolution("NBIM_WRONG")
+    assert models == [SMALL_MODEL, LARGE_MODEL]
+
+    metrics = get_routing_metrics()["tax"]
+    assert metrics[SMALL_MODEL]["escalation_rate"] == 1.0
+    assert metrics[LARGE_MODEL]["calls"] == 1
+
+
+def test_need_info_and_low_confidence_are_accepted_when_not_escalated_on(monkeypatch):
+    monkeypatch.setitem(ROUTING_POLICIES, "test-agent", {
+        "models": [SMALL_MODEL, LARGE_MODEL], "escalate_on_need_info": False, "escalate_on_low_confidence": False,
+    })
+    call, models = _stub(_resolution(conclusion="NEED_INFO", confidence="LOW"))
+    assert route_call("test-agent", call, validate_json_resolution) == _resolution("NEED_INFO", "LOW")
+    assert models == [SMALL_MODEL]
+
+
+def test_cheap_tier_exception_escalates():
+    call, models = _stub(RuntimeError("overloaded"), _resolution())
+    assert route_call("tax", call, validate_json_resolution) == _resolution()
+    assert models == [SMALL_MODEL, LARGE_MODEL]
+    assert get_routing_metrics()["tax"][SMALL_MODEL]["escalations"] == 1
+
+
+def test_last_tier_exception_is_raised():
+    call, _ = _stub(RuntimeError("overloaded"), RuntimeError("still overloaded"))
+    with pytest.raises(RuntimeError, match="still overloaded"):
+        route_call("tax", call, validate_json_resolution)
+    assert get_routing_metrics()["tax"][LARGE_MODEL]["calls"] == 1
+
+
+def test_last_tier_response_is_returned_even_when_invalid():
+    call, models = _stub("not json", _resolution(conclusion="NEED_INFO"))
+    assert route_call("tax", call, validate_json_resolution) == _resolution(conclusion="NEED_INFO")
+    assert models == [SMALL_MODEL, LARGE_MODEL]
+    assert get_routing_metrics()["tax"][LARGE_MODEL]["escalations"] == 0
+
+
+def test_classification_escalates_on_invalid_problems():
+    valid = json.dumps({"problems": [{"name": "Tax Break", "explanation": "rates differ"}]})
+    call, models = _stub(json.dumps({"problems": [{"explanation": "no name"}]}), valid)
+    assert route_call("classification", call, validate_json_classification) == valid
+    assert models == [SMALL_MODEL, LARGE_MODEL]
+
+
+def test_unknown_agent_uses_only_the_large_model():
+    call, models = _stub("anything")
+    assert route_call("unknown-agent", call) == "anything"
+    assert models == [LARGE_MODEL]
+
+
+def test_reset_routing_metrics():
+    call, _ = _stub(_resolution())
+    route_call("tax", call, validate_json_resolution)
+    reset_routing_metrics()
+    assert get_routing_metrics() == {}
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.data_preparation import process_data
+from lib.discrepancy_detection import detect_all_discrepancies
+from lib.partitioned_join import iter_detected_partitions, process_data_partitioned
+from lib.records import flag_break_rows
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+NBIM_FILE = os.path.join(DATA_FOLDER, "NBIM_Dividend_Bookings.csv")
+CUSTODY_FILE = os.path.join(DATA_FOLDER, "CUSTODY_Dividend_Bookings.csv")
+
+
+def _single_merge(nbim_file, custody_file) -> pd.DataFrame:
+    return detect_all_discrepancies(process_data(nbim_file, custody_file))
+
+
+@pytest.fixture(scope="module")
+def generated_files(tmp_path_factory):
+    """
+    Larger files sampled from the sample data, with repeated event keys, several bank accounts
+    per event, unmatched rows on both sides and missing tickers.
+    """
+    rows = 400
+    rng = np.random.default_rng(0)
+    nbim = pd.read_csv(NBIM_FILE, sep=';').sample(rows, replace=True, random_state=1).reset_index(drop=True)
+    custody = pd.read_csv(CUSTODY_FILE, sep=';').sample(rows, replace=True, random_state=2).reset_index(drop=True)
+
+    keys = rng.integers(1, rows // 2, rows)
+    nbim['COAC_EVENT_KEY'] = keys
+    nbim['BANK_ACCOUNT'] = rng.integers(1, 4, rows)
+    matched = rng.random(rows) < 0.9
+    custody['COAC_EVENT_KEY'] = np.where(matched, keys, rng.integers(rows, 2 * rows, rows))
+    custody['CUSTODY'] = np.where(matched, nbim['BANK_ACCOUNT'], 5)
+    custody['BANK_ACCOUNTS'] = custody['CUSTODY']
+    nbim.loc[rng.random(rows) < 0.05, 'TICKER'] = np.nan
+
+    folder = tmp_path_factory.mktemp("generated")
+    nbim_file, custody_file = str(folder / "NBIM.csv"), str(folder / "CUSTODY.csv")
+    nbim.to_csv(nbim_file, sep=';', index=False)
+    custody.to_csv(custody_file, sep=';', index=False)
+    return nbim_file, custody_file
+
+
+@pytest.mark.parametrize("partitions", [1, 3, 8])
+def test_partitioned_join_equals_single_merge_on_sample_files(partitions):
+    partitioned = process_data_partitioned(NBIM_FILE, CUSTODY_FILE, partitions=partitions, workers=2)
+    pd.testing.assert_frame_equal(partitioned, _single_merge(NBIM_FILE, CUSTODY_FILE))
+
+
+@pytest.mark.parametrize("partitions,chunksize", [(4, 100_000), (7, 64)])
+def test_partitioned_join_equals_single_merge_on_generated_files(generated_files, partitions, chunksize):
+    partitioned = process_data_partitioned(*generated_files, partitions=partitions, workers=2, chunksize=chunksize)
+    pd.testing.assert_frame_equal(partitioned, _single_merge(*generated_files))
+
+
+def test_partitions_return_only_row_counts_and_flagged_rows(generated_files):
+    merged_df = _single_merge(*generated_files)
+    partitions = list(iter_detected_partitions(*generated_files, partitions=5, workers=2))
+
+    assert len(partitions) == 5
+    assert sum(row_count for row_count, _, _ in partitions) == len(merged_df)
+    assert sum(len(flagged_df) for _, flagged_df, _ in partitions) == len(flag_break_rows(merged_df))
+    assert all(frame_path is None for _, _, frame_path in partitions)
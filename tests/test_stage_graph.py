@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from lib.stage_graph import StageGraph
+
+
+def _pipeline(on_event=None, cancel_event=None, double=None, total_workers=1):
+    """source -> double -> total, where total sums its items and emits the sum to report on close."""
+    graph = StageGraph(on_event=on_event, cancel_event=cancel_event)
+    seen = {"total": [], "report": []}
+    lock = threading.Lock()
+
+    def add(item, emit):
+        with lock:
+            seen["total"].append(item)
+
+    graph.add_stage("source", lambda item, emit: emit("double", item), 2, 4, downstream=["double"])
+    graph.add_stage("double", double or (lambda item, emit: emit("total", item * 2)), 3, 4, downstream=["total"])
+    graph.add_stage("total", add, total_workers, 4, downstream=["report"],
+                    on_close=lambda emit: emit("report", sum(seen["total"])))
+    graph.add_stage("report", lambda item, emit: seen["report"].append(item))
+    return graph, seen
+
+
+def test_items_flow_through_all_stages():
+    graph, seen = _pipeline()
+    assert graph.run("source", range(100)) == []
+    assert sorted(seen["total"]) == [item * 2 for item in range(100)]
+
+
+def test_on_close_emits_after_all_upstream_items_are_done():
+    def slow_double(item, emit):
+        time.sleep(0.001 * (item % 5))
+        emit("total", item * 2)
+
+    graph, seen = _pipeline(double=slow_double)
+    graph.run("source", range(50))
+    assert seen["report"] == [sum(item * 2 for item in range(50))]
+
+
+def test_stages_are_closed_in_topological_order():
+    closed = []
+    graph = StageGraph()
+    # Added out of order: a -> b -> d and a -> c -> d
+    graph.add_stage("d", lambda item, emit: None, on_close=lambda emit: closed.append("d"))
+    graph.add_stage("b", lambda item, emit: None, downstream=["d"], on_close=lambda emit: closed.append("b"))
+    graph.add_stage("c", lambda item, emit: None, downstream=["d"], on_close=lambda emit: closed.append("c"))
+    graph.add_stage("a", lambda item, emit: None, downstream=["b", "c"], on_close=lambda emit: closed.append("a"))
+
+    graph.run("a", [1])
+    assert closed[0] == "a"
+    assert closed[-1] == "d"
+    assert sorted(closed[1:3]) == ["b", "c"]
+
+
+def test_failed_items_are_collected_and_the_others_continue():
+    events = []
+
+    def failing_double(item, emit):
+        if item % 10 == 0:
+            raise ValueError(f"bad item {item}")
+        emit("total", item * 2)
+
+    graph, seen = _pipeline(on_event=events.append, double=failing_double)
+    errors = graph.run("source", range(30))
+
+    assert sorted(item for _, item, _ in errors) == [0, 10, 20]
+    assert all(stage == "double" and isinstance(error, ValueError) for stage, _, error in errors)
+    assert len(seen["total"]) == 27
+    assert seen["report"] == [sum(item * 2 for item in range(30) if item % 10)]
+    failed = [event for event in events if event["status"] == "failed"]
+    assert sorted(event["item"] for event in failed) == [0, 10, 20]
+
+
+def test_on_close_failure_is_collected():
+    events = []
+    graph = StageGraph(on_event=events.append)
+    graph.add_stage("a", lambda item, emit: None, on_close=lambda emit: 1 / 0)
+
+    errors = graph.run("a", [1, 2])
+    assert [(stage, item) for stage, item, _ in errors] == [("a", None)]
+    assert isinstance(errors[0][2], ZeroDivisionError)
+    assert events[-1]["status"] == "failed" and events[-1]["item"] is None
+
+
+def test_emit_to_unconnected_stage_fails_the_item():
+    graph = StageGraph()
+    graph.add_stage("a", lambda item, emit: emit("c", item), downstream=["b"])
+    graph.add_stage("b", lambda item, emit: None)
+    graph.add_stage("c", lambda item, emit: None)
+
+    errors = graph.run("a", [1])
+    assert len(errors) == 1 and isinstance(errors[0][2], ValueError)
+
+
+def test_events_count_every_queued_item():
+    events = []
+    lock = threading.Lock()
+
+    def on_event(event):
+        with lock:
+            events.append((event["stage"], event["status"]))
+
+    graph, _ = _pipeline(on_event=on_event)
+    graph.run("source", range(20))
+    for stage in ("source", "double", "total"):
+        assert events.count((stage, "queued")) == 20
+        assert events.count((stage, "completed")) == 20
+    assert events.count(("report", "queued")) == 1
+
+
+def test_cancel_stops_scheduling_new_work():
+    cancel_event = threading.Event()
+    started = []
+
+    def double(item, emit):
+        started.append(item)
+        if item == 0:
+            cancel_event.set()
+        emit("total", item * 2)
+
+    graph, seen = _pipeline(cancel_event=cancel_event, double=double)
+    graph.stages["source"].workers = 1
+    graph.stages["double"].workers = 1
+    errors = graph.run("source", range(1000))
+
+    assert errors == []
+    assert len(started) < 1000
+    # Emits after cancelling are dropped, and on_close does not run
+    assert seen["total"] == []
+    assert seen["report"] == []
+
+
+def test_cancel_before_run_skips_all_items():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    graph, seen = _pipeline(cancel_event=cancel_event)
+    assert graph.run("source", range(10)) == []
+    assert seen == {"total": [], "report": []}
+
+
+def test_duplicate_stage_is_rejected():
+    graph = StageGraph()
+    graph.add_stage("a", lambda item, emit: None)
+    with pytest.raises(ValueError):
+        graph.add_stage("a", lambda item, emit: None)
+
+
+def test_unknown_downstream_stage_is_rejected():
+    graph = StageGraph()
+    graph.add_stage("a", lambda item, emit: None, downstream=["missing"])
+    with pytest.raises(ValueError, match="unknown stage"):
+        graph.run("a", [1])
+
+
+def test_cycle_is_rejected():
+    graph = StageGraph()
+    graph.add_stage("a", lambda item, emit: None, downstream=["b"])
+    graph.add_stage("b", lambda item, emit: None, downstream=["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        graph.run("a", [1])
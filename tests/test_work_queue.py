@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+from lib.work_queue import WorkQueue
+
+VISIBILITY_TIMEOUT_S = 0.05
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(str(tmp_path / "queue.db"), visibility_timeout_s=VISIBILITY_TIMEOUT_S, max_attempts=2)
+
+
+def _sealed_run(queue, payloads):
+    run_id = queue.create_run()
+    for payload in payloads:
+        queue.enqueue(run_id, payload)
+    queue.seal_run(run_id)
+    return run_id
+
+
+def _wait_for_lease_expiry():
+    time.sleep(VISIBILITY_TIMEOUT_S * 2)
+
+
+def test_lease_and_complete(queue):
+    run_id = _sealed_run(queue, [{"coac_id": 1}])
+
+    task = queue.lease("worker-1")
+    assert task["run_id"] == run_id
+    assert task["payload"] == {"coac_id": 1}
+    assert task["attempt"] == 1
+    assert queue.lease("worker-2") is None
+
+    assert queue.complete(task["task_id"], "worker-1", {"conclusion": "NBIM_WRONG"})
+    assert queue.run_status(run_id) == {"sealed": True, "counts": {"done": 1}, "finished": True}
+    assert queue.run_tasks(run_id)[0]["result"] == {"conclusion": "NBIM_WRONG"}
+
+
+def test_run_is_not_finished_until_sealed(queue):
+    run_id = queue.create_run()
+    task_id = queue.enqueue(run_id, {"coac_id": 1})
+    queue.complete(queue.lease("worker-1")["task_id"], "worker-1", {})
+
+    assert not queue.run_status(run_id)["finished"]
+    queue.seal_run(run_id)
+    assert queue.run_status(run_id)["finished"]
+    assert queue.run_tasks(run_id)[0]["task_id"] == task_id
+
+
+def test_expired_lease_is_retried_by_another_worker(queue):
+    _sealed_run(queue, [{"coac_id": 1}])
+    task = queue.lease("worker-1")
+
+    _wait_for_lease_expiry()
+    retried = queue.lease("worker-2")
+    assert retried["task_id"] == task["task_id"]
+    assert retried["attempt"] == 2
+
+    # The first worker lost its lease, so its late result is rejected
+    assert not queue.complete(task["task_id"], "worker-1", {"conclusion": "NBIM_WRONG"})
+    assert queue.complete(task["task_id"], "worker-2", {"conclusion": "CUSTODY_WRONG"})
+
+
+def test_failed_task_is_retried_then_dead(queue):
+    run_id = _sealed_run(queue, [{"coac_id": 1}])
+
+    queue.fail(queue.lease("worker-1")["task_id"], "worker-1", "first error")
+    assert queue.run_status(run_id)["counts"] == {"pending": 1}
+
+    task = queue.lease("worker-1")
+    assert task["attempt"] == 2
+    queue.fail(task["task_id"], "worker-1", "second error")
+
+    assert queue.lease("worker-1") is None
+    assert queue.run_status(run_id) == {"sealed": True, "counts": {"dead": 1}, "finished": True}
+    assert queue.run_tasks(run_id)[0]["error"] == "second error"
+
+
+def test_run_status_marks_exhausted_expired_leases_dead(queue):
+    run_id = _sealed_run(queue, [{"coac_id": 1}])
+    for _ in range(queue.max_attempts):
+        assert queue.lease("worker-1") is not None
+        _wait_for_lease_expiry()
+
+    # No worker polls any more, but the run still finishes
+    status = queue.run_status(run_id)
+    assert status["counts"] == {"dead": 1}
+    assert status["finished"]
+    assert queue.run_tasks(run_id)[0]["error"] == "Lease expired"
+
+
+def test_run_status_of_unknown_run(queue):
+    with pytest.raises(KeyError):
+        queue.run_status("missing")
+
+
+def test_extended_lease_is_not_leased_again(queue):
+    _sealed_run(queue, [{"coac_id": 1}])
+    task = queue.lease("worker-1")
+
+    for _ in range(3):
+        time.sleep(VISIBILITY_TIMEOUT_S / 2)
+        assert queue.extend_lease(task["task_id"], "worker-1")
+    assert queue.lease("worker-2") is None
+    assert queue.complete(task["task_id"], "worker-1", {"conclusion": "NBIM_WRONG"})
+
+
+def test_lost_lease_cannot_be_extended(queue):
+    _sealed_run(queue, [{"coac_id": 1}])
+    task = queue.lease("worker-1")
+
+    _wait_for_lease_expiry()
+    assert queue.lease("worker-2")["task_id"] == task["task_id"]
+    assert not queue.extend_lease(task["task_id"], "worker-1")
+
+
+def test_run_id_must_be_unique(queue):
+    queue.create_run("r1")
+    with pytest.raises(ValueError):
+        queue.create_run("r1")
@@ -0,0 +1,64 @@
+"""
+Distributed break resolution through a durable local work queue (a SQLite file).
+
+Usage:
+    python worker.py enqueue --nbim data/NBIM_Dividend_Bookings.csv --custody data/CUSTODY_Dividend_Bookings.csv
+    python worker.py work                   # start as many workers as needed, on any host sharing the queue file
+    python worker.py collect --run-id <id>  # wait for the run, then prioritize and write data/output.csv
+"""
+import argparse
+import sys
+
+from app import ReconciliationError, collect_queued_results, enqueue_dividend_reconciliation, run_resolution_worker
+from lib.work_queue import WorkQueue
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Resolve dividend breaks through a shared work queue.")
+    parser.add_argument("--queue", default="data/work_queue.db", help="Path of the SQLite queue file")
+    parser.add_argument("--visibility-timeout", type=float, default=900, help="Seconds before a leased task is retried")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts before a task is marked dead")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Detect and classify breaks and enqueue them")
+    enqueue.add_argument("--nbim", required=True)
+    enqueue.add_argument("--custody", required=True)
+    enqueue.add_argument("--run-id")
+
+    work = commands.add_parser("work", help="Lease and resolve tasks")
+    work.add_argument("--worker-id")
+    work.add_argument("--poll-interval", type=float, default=5.0)
+    work.add_argument("--exit-when-idle", action="store_true")
+
+    collect = commands.add_parser("collect", help="Assemble, prioritize and save the results of a run")
+    collect.add_argument("--run-id", required=True)
+    collect.add_argument("--poll-interval", type=float, default=10.0)
+    collect.add_argument("--timeout", type=float)
+    collect.add_argument("--data-folder", default="data")
+
+    args = parser.parse_args(argv)
+    queue = WorkQueue(args.queue, visibility_timeout_s=args.visibility_timeout, max_attempts=args.max_attempts)
+
+    if args.command == "enqueue":
+        try:
+            print(enqueue_dividend_reconciliation(args.nbim, args.custody, queue, args.run_id))
+        except (ReconciliationError, ValueError) as e:
+            print(e)
+            return 1
+    elif args.command == "work":
+        handled = run_resolution_worker(queue, args.worker_id, args.poll_interval, args.exit_when_idle)
+        print(f"Handled {handled} task(s)")
+    elif args.command == "collect":
+        try:
+            queue.run_status(args.run_id)
+        except KeyError as e:
+            print(e.args[0])
+            return 1
+        try:
+            collect_queued_results(queue, args.run_id, args.poll_interval, args.timeout, args.data_folder)
+        except TimeoutError as e:
+            print(e)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())